@@ -32,31 +32,223 @@ EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
 """
 
 import asyncio
+import codecs
+import contextlib
 import contextvars
+import dataclasses
+import dis
+import email.utils
+import functools
+import hashlib
 import inspect
+import io
 import json
+import mimetypes
+import operator
 import os
 import re
+import shutil
+import tempfile
+import threading
 import time
+import types
+import typing
 import uuid
+import zlib
 from abc import ABC, abstractmethod
-from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+from collections import OrderedDict
+from collections.abc import Mapping
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
 from urllib.parse import parse_qs
 
 try:
-    from jinja2 import Environment, FileSystemLoader, select_autoescape
+    from jinja2 import Environment, FileSystemBytecodeCache, FileSystemLoader, select_autoescape
     JINJA_INSTALLED = True
 except ImportError:
     JINJA_INSTALLED = False
 
 try:
-    import aiofiles, aiofiles.os
-    from multipart import PushMultipartParser, MultipartSegment
+    import orjson
+    JSON_BACKEND = "orjson"
+except ImportError:
+    try:
+        import ujson
+        JSON_BACKEND = "ujson"
+    except ImportError:
+        JSON_BACKEND = "json"
+
+try:
+    import brotli
+    BROTLI_INSTALLED = True
+except ImportError:
+    BROTLI_INSTALLED = False
+
+try:
+    from multipart import MultipartError, PushMultipartParser, MultipartSegment
     MULTIPART_INSTALLED = True
 except ImportError:
     MULTIPART_INSTALLED = False
 
 
+# -----------------------------
+# JSON Codec
+# -----------------------------
+if JSON_BACKEND == "orjson":
+    _ORJSON_OPTIONS = orjson.OPT_NON_STR_KEYS
+
+    def json_dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+        return orjson.dumps(obj, default=default, option=_ORJSON_OPTIONS)
+
+    json_loads: Callable[[Union[bytes, str]], Any] = orjson.loads
+elif JSON_BACKEND == "ujson":
+    def json_dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+        return ujson.dumps(obj, ensure_ascii=False, default=default).encode("utf-8")
+
+    json_loads = ujson.loads
+else:
+    def json_dumps(obj: Any, default: Optional[Callable[[Any], Any]] = None) -> bytes:
+        return json.dumps(obj, default=default).encode("utf-8")
+
+    json_loads = json.loads
+
+json_dumps.__doc__ = f"Serialize an object to JSON bytes using {JSON_BACKEND}."
+
+# Per-type encoders for dataclass and __slots__ response models.
+_MODEL_ENCODERS: Dict[type, Optional[Callable[[Any], Dict[str, Any]]]] = {}
+
+
+def _model_fields(cls: type) -> Optional[Tuple[str, ...]]:
+    """Return the public field names of a dataclass or __slots__ class, or None."""
+    if dataclasses.is_dataclass(cls):
+        return tuple(f.name for f in dataclasses.fields(cls))
+    if cls.__module__ == "builtins" or hasattr(cls, "__iter__") or hasattr(cls, "__aiter__"):
+        return None
+    names: List[str] = []
+    for klass in reversed(cls.__mro__):
+        slots = vars(klass).get("__slots__", ())
+        for name in (slots,) if isinstance(slots, str) else slots:
+            if not name.startswith("_") and name not in names:
+                names.append(name)
+    return tuple(names) if "__slots__" in vars(cls) else None
+
+
+def _model_encoder(cls: type) -> Optional[Callable[[Any], Dict[str, Any]]]:
+    """
+    Return the cached encoder for a response model type, compiling it on first use.
+
+    The encoder fetches every field with a single `operator.attrgetter`
+    call, so encoding an instance needs no per-object introspection.
+
+    Args:
+        cls: The type of the object being encoded.
+
+    Returns:
+        A callable turning an instance into a dict, or None if the type
+        isn't a dataclass or __slots__ class.
+    """
+    try:
+        return _MODEL_ENCODERS[cls]
+    except KeyError:
+        pass
+    names = _model_fields(cls)
+    if names is None:
+        encoder = None
+    elif len(names) == 1:
+        name = names[0]
+        encoder = lambda obj: {name: getattr(obj, name)}
+    elif names:
+        getter = operator.attrgetter(*names)
+        encoder = lambda obj: dict(zip(names, getter(obj)))
+    else:
+        encoder = lambda obj: {}
+    _MODEL_ENCODERS[cls] = encoder
+    return encoder
+
+
+def _encode_model(obj: Any) -> Dict[str, Any]:
+    """JSON `default` hook serializing response models with their cached encoder."""
+    encoder = _model_encoder(type(obj))
+    if encoder is None:
+        raise TypeError(f"Object of type {type(obj).__name__} is not JSON serializable")
+    return encoder(obj)
+
+
+# -----------------------------
+# Streaming Responses
+# -----------------------------
+class JsonStream:
+    """
+    A JSON response encoded item by item while it is sent.
+
+    Return a `JsonStream` from a handler to send the items of an
+    iterable or async iterable as a JSON array, or as newline-delimited
+    JSON when `ndjson` is true. Items are serialized one at a time and
+    coalesced into chunks of about `chunk_size` bytes, so memory use
+    depends on the chunk size rather than on the number of items.
+    """
+    __slots__ = ("items", "ndjson", "chunk_size")
+
+    def __init__(self, items: Any, ndjson: bool = False, chunk_size: int = 64 * 1024) -> None:
+        self.items: Any = items
+        self.ndjson: bool = ndjson
+        self.chunk_size: int = chunk_size
+
+    @property
+    def content_type(self) -> str:
+        return "application/x-ndjson" if self.ndjson else "application/json"
+
+    async def encode(self, dumps: Callable[[Any], bytes], items: Any = None) -> AsyncIterator[bytes]:
+        """
+        Serialize the items into body chunks.
+
+        Args:
+            dumps: The JSON encoder used for each item.
+            items: The items to encode, if they should be read from
+                somewhere other than `self.items` (e.g. an executor-backed
+                async iterator).
+
+        Yields:
+            Chunks of the encoded document.
+        """
+        if items is None:
+            items = self.items
+        if not hasattr(items, "__aiter__"):
+            items = _aiter_sync(items)
+        ndjson, chunk_size = self.ndjson, self.chunk_size
+        buffer: List[bytes] = [] if ndjson else [b"["]
+        size = len(buffer)
+        separator = b"\n" if ndjson else b","
+        first = True
+        async for item in items:
+            data = dumps(item)
+            if ndjson:
+                buffer.append(data)
+                buffer.append(separator)
+            else:
+                if not first:
+                    buffer.append(separator)
+                buffer.append(data)
+            first = False
+            size += len(data) + 1
+            if size >= chunk_size:
+                yield b"".join(buffer)
+                buffer.clear()
+                size = 0
+        if not ndjson:
+            buffer.append(b"]")
+        if buffer:
+            yield b"".join(buffer)
+
+    def __repr__(self) -> str:
+        return f"JsonStream(ndjson={self.ndjson!r}, chunk_size={self.chunk_size!r})"
+
+
+async def _aiter_sync(iterable: Any) -> AsyncIterator[Any]:
+    for item in iterable:
+        yield item
+
+
 # -----------------------------
 # Session Backend Abstraction
 # -----------------------------
@@ -102,352 +294,2973 @@ class InMemorySessionBackend(SessionBackend):
         self.last_access[session_id] = time.time()
 
 
+# -----------------------------
+# Upload Storage Abstraction
+# -----------------------------
+class UploadedFile:
+    """
+    A file part of a multipart request, as stored by an `UploadStorage`.
+
+    Stored files are removed when the request ends unless the handler
+    calls `keep()` or moves them somewhere else with `save()`.
+    """
+    def __init__(self, filename: str, content_type: str) -> None:
+        """
+        Initialize a new, empty upload.
+
+        Args:
+            filename: The filename sent by the client.
+            content_type: The content type sent by the client.
+        """
+        self.filename: str = filename
+        self.content_type: str = content_type
+        self.size: int = 0
+        self.file: Optional[Any] = None  # Binary file object, positioned at 0 once stored
+        self.path: Optional[str] = None  # Location on disk, if the upload was spilled
+        self.kept: bool = False
+
+    def keep(self) -> None:
+        """Leave the stored file in place when the request ends."""
+        self.kept = True
+
+    async def read(self) -> bytes:
+        """
+        Read the whole upload.
+
+        Returns:
+            The file contents.
+        """
+        assert self.file is not None
+        if self.path is None:
+            self.file.seek(0)
+            return self.file.read()
+        def read_file() -> bytes:
+            self.file.seek(0)
+            return self.file.read()
+        return await asyncio.to_thread(read_file)
+
+    async def save(self, destination: str) -> str:
+        """
+        Move the upload to a permanent location.
+
+        Args:
+            destination: The path to save the file to.
+
+        Returns:
+            The destination path.
+        """
+        assert self.file is not None
+        if self.path is None:
+            self.file.seek(0)
+            data = self.file.read()
+            def write_file() -> None:
+                with open(destination, "wb") as f:
+                    f.write(data)
+            await asyncio.to_thread(write_file)
+        else:
+            await asyncio.to_thread(self.file.close)
+            await asyncio.to_thread(shutil.move, self.path, destination)
+            self.file = None
+        self.path = destination
+        self.kept = True
+        return destination
+
+    def __getitem__(self, key: str) -> Any:
+        # Dictionary-style access kept for handlers written against the
+        # {"filename", "content_type"} upload dictionaries. There is no
+        # "saved_path": stored uploads are temporary, use `save()` instead.
+        if key in ("filename", "content_type", "size"):
+            return getattr(self, key)
+        raise KeyError(key)
+
+    def get(self, key: str, default: Any = None) -> Any:
+        try:
+            return self[key]
+        except KeyError:
+            return default
+
+    def __repr__(self) -> str:
+        return f"UploadedFile(filename={self.filename!r}, content_type={self.content_type!r}, size={self.size})"
+
+
+class UploadStorage(ABC):
+    """Decides where multipart file parts are written while a request is parsed."""
+
+    @abstractmethod
+    async def open(self, filename: str, content_type: str) -> UploadedFile:
+        """
+        Start storing a new upload.
+
+        Args:
+            filename: str
+            content_type: str
+        """
+        pass
+
+    @abstractmethod
+    async def write(self, upload: UploadedFile, data: bytes) -> None:
+        """
+        Append a chunk of data to an upload.
+
+        Args:
+            upload: UploadedFile
+            data: bytes
+        """
+        pass
+
+    @abstractmethod
+    async def close(self, upload: UploadedFile) -> None:
+        """
+        Finish an upload so the handler can read it.
+
+        Args:
+            upload: UploadedFile
+        """
+        pass
+
+    @abstractmethod
+    async def cleanup(self, upload: UploadedFile) -> None:
+        """
+        Release an upload at the end of the request (unless it was kept).
+
+        Args:
+            upload: UploadedFile
+        """
+        pass
+
+
+class SpooledUploadStorage(UploadStorage):
+    """
+    Keeps small uploads in memory and spills larger ones to a temp directory.
+
+    Data for spilled uploads is buffered and written in large batches, so a
+    big upload costs one thread handoff per `buffer_size` bytes rather than
+    one per received chunk.
+    """
+    def __init__(
+        self,
+        max_memory_size: int = 1024 * 1024,
+        directory: Optional[str] = None,
+        buffer_size: int = 256 * 1024
+    ) -> None:
+        """
+        Args:
+            max_memory_size: Uploads up to this many bytes stay in memory.
+            directory: Where larger uploads are written, defaults to the
+                system temp directory.
+            buffer_size: How many bytes to buffer before writing to disk.
+        """
+        self.max_memory_size: int = max_memory_size
+        self.directory: Optional[str] = directory
+        self.buffer_size: int = buffer_size
+        # Data of spilled uploads waiting to be written to disk.
+        self._buffers: Dict[UploadedFile, bytearray] = {}
+
+    async def open(self, filename: str, content_type: str) -> UploadedFile:
+        upload = UploadedFile(filename, content_type)
+        upload.file = io.BytesIO()
+        return upload
+
+    async def write(self, upload: UploadedFile, data: bytes) -> None:
+        upload.size += len(data)
+        if upload.path is None and upload.size <= self.max_memory_size:
+            upload.file.write(data)
+            return
+        buffer = self._buffers.setdefault(upload, bytearray())
+        buffer += data
+        if len(buffer) >= self.buffer_size:
+            del self._buffers[upload]
+            await asyncio.to_thread(self._flush, upload, buffer)
+
+    async def close(self, upload: UploadedFile) -> None:
+        buffer = self._buffers.pop(upload, None)
+        if upload.path is None and buffer is None:
+            upload.file.seek(0)
+        else:
+            def finish() -> None:
+                self._flush(upload, buffer or b"")
+                upload.file.flush()
+                upload.file.seek(0)
+            await asyncio.to_thread(finish)
+
+    async def cleanup(self, upload: UploadedFile) -> None:
+        self._buffers.pop(upload, None)
+        if upload.kept:
+            return
+        if upload.path is None:
+            if upload.file is not None:
+                upload.file.close()
+            return
+        def remove() -> None:
+            if upload.file is not None:
+                upload.file.close()
+            with contextlib.suppress(OSError):
+                os.remove(upload.path)
+        await asyncio.to_thread(remove)
+
+    def _flush(self, upload: UploadedFile, data: Union[bytes, bytearray]) -> None:
+        if upload.path is None:
+            if self.directory:
+                os.makedirs(self.directory, exist_ok=True)
+            spilled = tempfile.NamedTemporaryFile(prefix="micropie-", dir=self.directory, delete=False)
+            spilled.write(upload.file.getbuffer())
+            upload.file = spilled
+            upload.path = spilled.name
+        upload.file.write(data)
+
+
+class UploadStream:
+    """
+    Async iterator over the bytes of one uploaded file, read straight from the client.
+
+    Annotate a handler parameter with `UploadStream` to receive the
+    multipart part of the same name (or the whole body for requests that
+    aren't multipart) without it being stored first. Data is only read
+    from the connection as the handler iterates, so memory use stays
+    constant and a slow consumer slows down the client.
+    """
+    def __init__(self, name: str, reader: "_MultipartReader") -> None:
+        self.name: str = name
+        self.filename: Optional[str] = None
+        self.content_type: Optional[str] = None
+        self._reader: "_MultipartReader" = reader
+        self._started: bool = False
+        self._finished: bool = False
+
+    def __aiter__(self) -> "UploadStream":
+        return self
+
+    async def __anext__(self) -> bytes:
+        if not self._started:
+            self._started = True
+            if not await self._reader.open(self):
+                self._finished = True
+        if self._finished:
+            raise StopAsyncIteration
+        chunk = await self._reader.read_chunk()
+        if chunk is None:
+            self._finished = True
+            raise StopAsyncIteration
+        return chunk
+
+    def __repr__(self) -> str:
+        return f"UploadStream(name={self.name!r}, filename={self.filename!r})"
+
+
+class JsonRecords:
+    """
+    Async iterator over the records of a JSON array or NDJSON request body.
+
+    Annotate a handler parameter with `JsonRecords` to receive the items
+    of a top-level JSON array (or the lines of an `application/x-ndjson`
+    body) decoded one at a time as the body arrives. Only the record
+    being decoded is buffered, so memory use depends on the size of one
+    record rather than on the size of the body. Like `UploadStream`, a
+    multipart part of the same name is read if the body is multipart.
+    """
+    _NDJSON_TYPES: Tuple[str, ...] = ("ndjson", "jsonl", "json-lines", "json-seq")
+    _WHITESPACE: "re.Pattern[str]" = re.compile(r"[ \t\n\r]*")
+    # Characters that can follow a complete number in an array.
+    _NUMBER_ENDS = frozenset(" \t\n\r,]")
+
+    def __init__(self, stream: UploadStream, loads: Optional[Callable[[Union[bytes, str]], Any]] = None) -> None:
+        self.stream: UploadStream = stream
+        self._loads: Callable[[Union[bytes, str]], Any] = loads or stream._reader.app._json_loads
+        self._records: Optional[AsyncIterator[Any]] = None
+
+    def __aiter__(self) -> "JsonRecords":
+        return self
+
+    async def __anext__(self) -> Any:
+        if self._records is None:
+            self._records = self._iterate().__aiter__()
+        return await self._records.__anext__()
+
+    async def _iterate(self) -> AsyncIterator[Any]:
+        chunks = self.stream.__aiter__()
+        try:
+            first = await chunks.__anext__()
+        except StopAsyncIteration:
+            return
+        content_type = (self.stream.content_type or "").lower()
+        if any(kind in content_type for kind in self._NDJSON_TYPES):
+            records = self._iterate_lines(first, chunks)
+        elif first.lstrip()[:1] == b"[" or not first.strip():
+            records = self._iterate_array(first, chunks)
+        else:
+            # A single JSON document that isn't an array is one record.
+            parts = [first]
+            async for chunk in chunks:
+                parts.append(chunk)
+            yield self._decode(b"".join(parts))
+            return
+        async for record in records:
+            yield record
+
+    def _decode(self, data: Union[bytes, str]) -> Any:
+        try:
+            return self._loads(data)
+        except ValueError:
+            raise _HttpError(400, "400 Bad Request: Invalid JSON body")
+
+    async def _iterate_lines(self, first: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+        """Decode newline-delimited records, buffering only the current line."""
+        partial: List[bytes] = []
+        chunk: Optional[bytes] = first
+        while chunk is not None:
+            if b"\n" in chunk:
+                lines = chunk.split(b"\n")
+                if partial:
+                    partial.append(lines[0])
+                    lines[0] = b"".join(partial)
+                    partial.clear()
+                partial.append(lines.pop())
+                for line in lines:
+                    if line.strip():
+                        yield self._decode(line)
+            else:
+                partial.append(chunk)
+            try:
+                chunk = await chunks.__anext__()
+            except StopAsyncIteration:
+                chunk = None
+        tail = b"".join(partial)
+        if tail.strip():
+            yield self._decode(tail)
+
+    async def _iterate_array(self, first: bytes, chunks: AsyncIterator[bytes]) -> AsyncIterator[Any]:
+        """
+        Decode the items of a top-level JSON array one at a time.
+
+        Each item is decoded with `json.JSONDecoder.raw_decode`, which can
+        start at an offset. A number that isn't yet followed by whitespace,
+        `,` or `]` is held back until more data arrives, since `12` may
+        continue as `123`, `12.5` or `12e3`. Anything but whitespace after
+        the closing `]` is rejected. After a failed attempt the
+        decoder waits until the undecoded tail has doubled before trying
+        again, so a large record arriving in many chunks is decoded in
+        linear time.
+        """
+        decoder = json.JSONDecoder()
+        utf8 = codecs.getincrementaldecoder("utf-8")()
+        skip = self._WHITESPACE.match
+        invalid = _HttpError(400, "400 Bad Request: Invalid JSON body")
+        try:
+            text = utf8.decode(first)
+        except UnicodeDecodeError:
+            raise invalid
+        pos = 0
+        retry_at = 0
+        eof = False
+        state = "open"  # then "first", "value", "separator" and "closed"
+        while True:
+            if not eof and (pos >= len(text) or len(text) - pos < retry_at):
+                try:
+                    chunk = await chunks.__anext__()
+                except StopAsyncIteration:
+                    chunk, eof = b"", True
+                try:
+                    text = text[pos:] + utf8.decode(chunk, final=eof)
+                except UnicodeDecodeError:
+                    raise invalid
+                pos = 0
+                continue
+            pos = skip(text, pos).end()
+            if pos >= len(text):
+                if eof:
+                    if state == "closed":
+                        return
+                    raise invalid
+                continue
+            char = text[pos]
+            if state == "closed":
+                raise invalid
+            if state == "open":
+                if char != "[":
+                    raise invalid
+                state = "first"
+                pos += 1
+            elif state == "separator" or (state == "first" and char == "]"):
+                if char == "]":
+                    state = "closed"
+                    pos += 1
+                    continue
+                if char != ",":
+                    raise invalid
+                state = "value"
+                pos += 1
+            else:
+                try:
+                    record, end = decoder.raw_decode(text, pos)
+                except ValueError:
+                    if eof:
+                        raise invalid
+                    retry_at = 2 * (len(text) - pos)
+                    continue
+                if (not eof and isinstance(record, (int, float)) and not isinstance(record, bool)
+                        and (end == len(text) or text[end] not in self._NUMBER_ENDS)):
+                    retry_at = len(text) - pos + 1
+                    continue
+                retry_at = 0
+                pos = end
+                state = "separator"
+                yield record
+
+
+class _MultipartReader:
+    """
+    Pull-based consumer of a request body shared by the request's `UploadStream`s.
+
+    Parts that are not being streamed are stored on the request as usual
+    (text fields in `body_params`, files through the upload storage) as
+    the reader moves past them.
+    """
+    _END: Any = object()
+
+    def __init__(
+        self,
+        app: "App",
+        request: "Request",
+        chunks: AsyncIterator[bytes],
+        boundary: Optional[bytes]
+    ) -> None:
+        self.app: "App" = app
+        self.request: "Request" = request
+        self._raw: Optional[AsyncIterator[bytes]] = None if boundary else chunks.__aiter__()
+        self._raw_claimed: bool = False
+        self._events: Optional[AsyncIterator[Any]] = (
+            app._multipart_events(chunks, boundary).__aiter__() if boundary else None
+        )
+        self._pending: Optional[Any] = None
+        self._active: Optional[UploadStream] = None
+
+    async def _next_event(self) -> Any:
+        assert self._events is not None
+        try:
+            return await self._events.__anext__()
+        except StopAsyncIteration:
+            return self._END
+
+    async def advance(self, names: Any) -> Optional[Any]:
+        """
+        Store parts until one named in `names` starts.
+
+        Args:
+            names: Field names to stop at.
+
+        Returns:
+            The `MultipartSegment` found, left pending, or None at the end.
+        """
+        if self._events is None:
+            return None
+        while True:
+            segment = self._pending
+            self._pending = None
+            if segment is None:
+                segment = await self._next_event()
+            if segment is self._END:
+                return None
+            if segment.name in names:
+                self._pending = segment
+                return segment
+            await self._store_part(segment)
+
+    async def _store_part(self, segment: Any) -> None:
+        storage = self.app.upload_storage
+        upload = None
+        if segment.filename:
+            upload = await storage.open(segment.filename, segment.content_type or "application/octet-stream")
+        value = bytearray()
+        try:
+            while (event := await self._next_event()) is not None and event is not self._END:
+                if upload is not None:
+                    await storage.write(upload, event)
+                else:
+                    value += event
+        except BaseException:
+            if upload is not None:
+                await storage.cleanup(upload)
+            raise
+        if upload is not None:
+            await storage.close(upload)
+            files = self.request.files
+            if segment.name in files:
+                await storage.cleanup(files[segment.name])
+            files[segment.name] = upload
+        else:
+            self.request.body_params.setdefault(segment.name, []).append(value.decode("utf-8", "ignore"))
+
+    async def open(self, stream: UploadStream) -> bool:
+        """
+        Position the reader at the start of a stream's data.
+
+        Args:
+            stream: The stream about to be read.
+
+        Returns:
+            False if the body has no part for the stream.
+        """
+        if self._active is not None and not self._active._finished:
+            while await self.read_chunk() is not None:
+                pass
+            self._active._finished = True
+        self._active = stream
+        if self._events is None:
+            # Not multipart: the first stream opened gets the whole body.
+            if self._raw_claimed:
+                return False
+            self._raw_claimed = True
+            stream.content_type = self.request.headers.get("content-type")
+            return True
+        segment = await self.advance((stream.name,))
+        if segment is None:
+            return False
+        self._pending = None
+        stream.filename = segment.filename
+        stream.content_type = segment.content_type
+        return True
+
+    async def read_chunk(self) -> Optional[bytes]:
+        """
+        Read the next chunk of the active part.
+
+        Returns:
+            Bytes, or None once the part (or the raw body) ends.
+        """
+        if self._events is None:
+            if self._raw is None:
+                return None
+            try:
+                return await self._raw.__anext__()
+            except StopAsyncIteration:
+                self._raw = None
+                return None
+        event = await self._next_event()
+        return None if event is self._END else event
+
+
 # -----------------------------
 # Request Object
 # -----------------------------
 current_request: contextvars.ContextVar[Any] = contextvars.ContextVar("current_request")
 
+class Headers(Mapping):
+    """
+    Case-insensitive, read-only view over the raw ASGI header list.
+
+    Nothing is decoded until a header is looked up, and repeated headers
+    are kept: indexing returns the first value while `getlist` returns
+    every value in the order they were received.
+    """
+    __slots__ = ("raw",)
+
+    def __init__(self, raw: Optional[List[Tuple[bytes, bytes]]] = None) -> None:
+        """
+        Wrap a list of raw header pairs.
+
+        Args:
+            raw: The `(name, value)` byte pairs from the ASGI scope.
+        """
+        self.raw: List[Tuple[bytes, bytes]] = raw if raw is not None else []
+
+    def getlist(self, name: str) -> List[str]:
+        """
+        Return every value sent for a header.
+
+        Args:
+            name: The header name, in any case.
+
+        Returns:
+            A list of decoded values, empty if the header is absent.
+        """
+        key = name.lower().encode("latin-1")
+        return [v.decode("utf-8", "replace") for k, v in self.raw if k.lower() == key]
+
+    def __getitem__(self, name: str) -> str:
+        key = name.lower().encode("latin-1")
+        for k, v in self.raw:
+            if k.lower() == key:
+                return v.decode("utf-8", "replace")
+        raise KeyError(name)
+
+    def __contains__(self, name: object) -> bool:
+        if not isinstance(name, str):
+            return False
+        key = name.lower().encode("latin-1")
+        return any(k.lower() == key for k, _ in self.raw)
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(dict.fromkeys(k.decode("latin-1").lower() for k, _ in self.raw))
+
+    def __len__(self) -> int:
+        return len({k.lower() for k, _ in self.raw})
+
+    def items(self) -> List[Tuple[str, str]]:  # type: ignore[override]
+        """Return every header as a decoded `(name, value)` pair, duplicates included."""
+        return [(k.decode("latin-1").lower(), v.decode("utf-8", "replace")) for k, v in self.raw]
+
+    def __repr__(self) -> str:
+        return f"Headers({self.items()!r})"
+
+
 class Request:
     """Represents an HTTP request in the MicroPie framework."""
+    __slots__ = (
+        "scope", "method", "path_params", "_headers", "_query_params", "_cookies",
+        "_body_params", "_get_json", "_session", "_files", "_loaders", "_skipped", "__dict__",
+    )
+
     def __init__(self, scope: Dict[str, Any]) -> None:
         """
         Initialize a new Request instance.
 
+        Headers stay as raw ASGI byte pairs, and the query string, cookies,
+        body parameters, files and session containers are only created the
+        first time they are accessed.
+
         Args:
             scope: The ASGI scope dictionary for the request.
         """
         self.scope: Dict[str, Any] = scope
         self.method: str = scope["method"]
         self.path_params: List[str] = []
-        self.query_params: Dict[str, List[str]] = {}
-        self.body_params: Dict[str, List[str]] = {}
-        self.get_json: Any = {}
-        self.session: Dict[str, Any] = {}
-        self.files: Dict[str, Any] = {}
-        self.headers: Dict[str, str] = {
-            k.decode("utf-8", errors="replace").lower(): v.decode("utf-8", errors="replace")
-            for k, v in scope.get("headers", [])
-        }
+        self._headers: Optional[Headers] = None
+        self._query_params: Optional[Dict[str, List[str]]] = None
+        self._cookies: Optional[Dict[str, str]] = None
+        self._body_params: Optional[Dict[str, List[Any]]] = None
+        self._get_json: Any = None
+        self._session: Optional[Dict[str, Any]] = None
+        self._files: Optional[Dict[str, Any]] = None
+        self._loaders: Optional[Dict[Any, "DataLoader"]] = None
+        # Inputs the framework chose not to load for this request ("body", "session").
+        self._skipped: Tuple[str, ...] = ()
+
+    @property
+    def headers(self) -> Headers:
+        """Case-insensitive view of the request headers."""
+        if self._headers is None:
+            self._headers = Headers(self.scope.get("headers"))
+        return self._headers
+
+    @property
+    def query_params(self) -> Dict[str, List[str]]:
+        """Dictionary of query parameters, parsed on first access."""
+        if self._query_params is None:
+            self._query_params = parse_qs(self.scope.get("query_string", b"").decode("utf-8", "ignore"))
+        return self._query_params
+
+    @query_params.setter
+    def query_params(self, value: Dict[str, List[str]]) -> None:
+        self._query_params = value
+
+    @property
+    def cookies(self) -> Dict[str, str]:
+        """Dictionary of request cookies, parsed on first access."""
+        if self._cookies is None:
+            self._cookies = _parse_cookie_header("; ".join(self.headers.getlist("cookie")))
+        return self._cookies
+
+    @property
+    def body_params(self) -> Dict[str, List[Any]]:
+        """Dictionary of body parameters (built from a JSON object body on first access)."""
+        if self._body_params is None:
+            self._check_loaded("body")
+            data = self._get_json
+            self._body_params = {k: [v] for k, v in data.items()} if isinstance(data, dict) else {}
+        return self._body_params
+
+    @body_params.setter
+    def body_params(self, value: Dict[str, List[Any]]) -> None:
+        self._body_params = value
+
+    @property
+    def get_json(self) -> Any:
+        """The decoded JSON request body."""
+        if self._get_json is None:
+            self._check_loaded("body")
+            self._get_json = {}
+        return self._get_json
+
+    @get_json.setter
+    def get_json(self, value: Any) -> None:
+        self._get_json = value
+
+    @property
+    def session(self) -> Dict[str, Any]:
+        """Dictionary of session data."""
+        if self._session is None:
+            self._check_loaded("session")
+            self._session = {}
+        return self._session
+
+    @session.setter
+    def session(self, value: Dict[str, Any]) -> None:
+        self._session = value
+
+    @property
+    def files(self) -> Dict[str, Any]:
+        """Dictionary of uploaded files."""
+        if self._files is None:
+            self._check_loaded("body")
+            self._files = {}
+        return self._files
+
+    @files.setter
+    def files(self, value: Dict[str, Any]) -> None:
+        self._files = value
+
+    def _check_loaded(self, name: str) -> None:
+        """
+        Fail loudly when an input the framework skipped is used.
+
+        Raises:
+            RuntimeError: If the request's `name` ("body" or "session") was
+                not loaded because the handler's code never references the
+                request.
+        """
+        if name in self._skipped:
+            raise RuntimeError(
+                f"The request {name} was not loaded because the handler never "
+                f"references the request; use self.request in the handler itself."
+            )
+
+    def loader(self, batch_fn: Callable[[List[Any]], Awaitable[Any]], max_batch_size: Optional[int] = None) -> "DataLoader":
+        """
+        Return this request's `DataLoader` for `batch_fn`, creating it on first use.
+
+        Args:
+            batch_fn: Async function fetching the values for a list of keys.
+            max_batch_size: The most keys passed to one `batch_fn` call, or None.
+
+        Returns:
+            The same loader for every call with the same `batch_fn`, so
+            results are shared for the rest of the request.
+        """
+        if self._loaders is None:
+            self._loaders = {}
+        loader = self._loaders.get(batch_fn)
+        if loader is None:
+            loader = self._loaders[batch_fn] = DataLoader(batch_fn, max_batch_size)
+        return loader
+
+
+def _parse_cookie_header(cookie_header: str) -> Dict[str, str]:
+    cookies: Dict[str, str] = {}
+    if not cookie_header:
+        return cookies
+    for cookie in cookie_header.split(";"):
+        if "=" in cookie:
+            k, v = cookie.strip().split("=", 1)
+            cookies[k] = v
+    return cookies
 
 
 # -----------------------------
-# Middleware Abstraction
+# Response Object
 # -----------------------------
-class HttpMiddleware(ABC):
+_DEFAULT_CONTENT_TYPE: Tuple[bytes, bytes] = (b"Content-Type", b"text/html; charset=utf-8")
+# Statuses that must not carry a body, and so get no Content-Length.
+_NO_BODY_STATUSES = frozenset((204, 304))
+
+
+def _encode_header(name: str, value: str) -> Tuple[bytes, bytes]:
     """
-    Pluggable middleware class that allows hooking into the request lifecycle.
+    Validate and latin-1 encode one response header.
+
+    Raises:
+        ValueError: If the name or value contains a CR or LF.
     """
+    if isinstance(name, bytes):
+        return name, value  # Already encoded (and validated) by another `Response`.
+    if "\n" in name or "\r" in name or "\n" in value or "\r" in value:
+        raise ValueError(f"Header injection attempt detected: {name}: {value}")
+    return name.encode("latin-1"), value.encode("latin-1")
 
-    @abstractmethod
-    async def before_request(self, request: Request) -> None:
+
+class Response:
+    """
+    An HTTP response whose body and headers are encoded up front.
+
+    Headers are validated and encoded when the response is created, so a
+    `Response` can be built once (e.g. as a module-level constant) and
+    returned from any number of requests. `bytes`, `bytearray` and
+    `memoryview` bodies are sent as they are, without being copied, and
+    fixed bodies get a `Content-Length` header automatically.
+    """
+    __slots__ = ("status_code", "body", "headers")
+
+    def __init__(
+        self,
+        body: Any = b"",
+        status_code: int = 200,
+        headers: Optional[List[Tuple[str, str]]] = None,
+        content_type: Optional[str] = None
+    ) -> None:
         """
-        Called before the request is processed.
+        Create the response.
+
+        Args:
+            body: The response body: a string, a bytes-like object, or an
+                iterator or async iterator for streaming responses.
+            status_code: The HTTP status code.
+            headers: Optional list of (name, value) header tuples.
+            content_type: Shortcut for a Content-Type header.
+
+        Raises:
+            ValueError: If a header contains a CR or LF.
         """
-        pass
+        encoded = [_encode_header(k, v) for k, v in headers or ()]
+        if content_type is not None:
+            encoded.append(_encode_header("Content-Type", content_type))
+        self.status_code: int = status_code
+        self.body: Any = body.encode("utf-8") if isinstance(body, str) else body
+        self.headers: Tuple[Tuple[bytes, bytes], ...] = tuple(encoded)
 
-    @abstractmethod
-    async def after_request(
+    def __repr__(self) -> str:
+        return f"Response(status_code={self.status_code!r}, headers={self.headers!r})"
+
+
+class FileResponse(Response):
+    """
+    A response that sends a file from disk, honouring `Range` requests.
+
+    Single ranges are answered with `206 Partial Content`, several ranges
+    with a `multipart/byteranges` body, and a `Range` is ignored when an
+    `If-Range` validator no longer matches. The file is sent with the
+    `http.response.pathsend` or `http.response.zerocopy` ASGI extension
+    when the server supports it, and otherwise read in chunks in a worker
+    thread so the event loop never blocks on disk I/O.
+    """
+    __slots__ = ("path", "content_type", "chunk_size", "stat")
+
+    def __init__(
         self,
-        request: Request,
-        status_code: int,
-        response_body: Any,
-        extra_headers: List[Tuple[str, str]]
+        path: Union[str, "os.PathLike[str]"],
+        status_code: int = 200,
+        headers: Optional[List[Tuple[str, str]]] = None,
+        content_type: Optional[str] = None,
+        filename: Optional[str] = None,
+        chunk_size: int = 256 * 1024,
+        stat: Optional[os.stat_result] = None
     ) -> None:
         """
-        Called after the request is processed, but before the final response
-        is sent to the client. You may alter the status_code, response_body,
-        or extra_headers if needed.
+        Create the response.
+
+        Args:
+            path: The file to send.
+            status_code: The HTTP status code for a full response.
+            headers: Optional list of (name, value) header tuples.
+            content_type: The Content-Type, guessed from the path if omitted.
+            filename: When set, the file is sent as a download with this name.
+            chunk_size: How many bytes to read at a time without zero-copy.
+            stat: The file's `os.stat` result, if already known.
+        """
+        self.path: str = os.fspath(path)
+        self.content_type: str = (
+            content_type or mimetypes.guess_type(self.path)[0] or "application/octet-stream"
+        )
+        headers = list(headers or ())
+        if filename is not None:
+            headers.append(("Content-Disposition", f'attachment; filename="{filename}"'))
+        super().__init__(b"", status_code, headers, self.content_type)
+        self.chunk_size: int = chunk_size
+        self.stat: Optional[os.stat_result] = stat
+
+    def __repr__(self) -> str:
+        return f"FileResponse(path={self.path!r}, status_code={self.status_code!r})"
+
+
+# At most this many ranges are served from one request; more send the whole file.
+_MAX_RANGES = 16
+
+
+def _parse_ranges(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse a `Range` header into inclusive (start, end) byte offsets.
+
+    Args:
+        header: The Range header value.
+        size: The size of the file.
+
+    Returns:
+        The satisfiable ranges (empty if none are), or None if the header
+        should be ignored because it is malformed or asks for too much.
+    """
+    unit, _, specs = header.partition("=")
+    if unit.strip().lower() != "bytes":
+        return None
+    ranges: List[Tuple[int, int]] = []
+    for spec in specs.split(","):
+        first, dash, last = spec.strip().partition("-")
+        if not dash or not (first.isdigit() or last.isdigit()):
+            return None
+        if not first:
+            if not last.isdigit():
+                return None
+            length = int(last)
+            if length:
+                ranges.append((max(size - length, 0), size - 1))
+            continue
+        if not first.isdigit() or (last and not last.isdigit()):
+            return None
+        start = int(first)
+        end = int(last) if last else size - 1
+        if end < start:
+            return None
+        if start < size:
+            ranges.append((start, min(end, size - 1)))
+    if len(ranges) > _MAX_RANGES:
+        return None
+    return ranges
+
+
+def _file_validators(stat: os.stat_result) -> Tuple[str, str]:
+    """Return the ETag and Last-Modified values for a file."""
+    return (
+        f'"{stat.st_mtime_ns:x}-{stat.st_size:x}"',
+        email.utils.formatdate(stat.st_mtime, usegmt=True),
+    )
+
+
+def _parse_accept_encoding(header: str) -> Dict[str, float]:
+    """
+    Parse an `Accept-Encoding` header.
+
+    Args:
+        header: The header value.
+
+    Returns:
+        A dictionary mapping lowercased content codings to their q-values.
+    """
+    accepted: Dict[str, float] = {}
+    for item in header.split(","):
+        coding, _, params = item.partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        quality = 1.0
+        params = params.strip()
+        if params[:2].lower() == "q=":
+            try:
+                quality = float(params[2:])
+            except ValueError:
+                quality = 0.0
+        accepted[coding] = quality
+    return accepted
+
+
+# -----------------------------
+# Caching
+# -----------------------------
+class _LRUCache:
+    """
+    A least-recently-used cache bounded by the total size of its values.
+
+    Each value is stored with the size it accounts for; the least recently
+    used entries are evicted once the total exceeds `max_size`. Values
+    larger than `max_size` are not stored. Not thread-safe: use it from the
+    event loop.
+    """
+    __slots__ = ("max_size", "size", "_items")
+
+    def __init__(self, max_size: int) -> None:
+        self.max_size: int = max_size
+        self.size: int = 0
+        self._items: "OrderedDict[Any, Tuple[Any, int]]" = OrderedDict()
+
+    def get(self, key: Any, default: Any = None) -> Any:
+        item = self._items.get(key)
+        if item is None:
+            return default
+        self._items.move_to_end(key)
+        return item[0]
+
+    def set(self, key: Any, value: Any, size: int) -> None:
+        self.pop(key)
+        if size > self.max_size:
+            return
+        self._items[key] = (value, size)
+        self.size += size
+        while self.size > self.max_size:
+            _, (_, evicted) = self._items.popitem(last=False)
+            self.size -= evicted
+
+    def pop(self, key: Any, default: Any = None) -> Any:
+        item = self._items.pop(key, None)
+        if item is None:
+            return default
+        self.size -= item[1]
+        return item[0]
+
+    def clear(self) -> None:
+        self._items.clear()
+        self.size = 0
+
+    def __contains__(self, key: Any) -> bool:
+        return key in self._items
+
+    def __len__(self) -> int:
+        return len(self._items)
+
+
+def memoize(
+    ttl: float = 60.0,
+    maxsize: int = 1024,
+    stale_ttl: float = 0.0
+) -> Callable[[Callable[..., Awaitable[Any]]], "_Memoized"]:
+    """
+    Cache the results of an async function.
+
+    Results are cached per arguments for `ttl` seconds, keeping at most
+    `maxsize` of them (least recently used first out). Concurrent calls
+    with the same arguments share one call. For `stale_ttl` seconds after
+    a result expires it is still returned at once while a fresh one is
+    fetched in the background. The decorated function has `cache_info()`
+    and `cache_clear()` methods.
+
+    Args:
+        ttl: Seconds a result is fresh.
+        maxsize: The most results kept.
+        stale_ttl: Seconds an expired result may still be served while
+            it is refreshed.
+
+    Returns:
+        A decorator for async functions and methods.
+    """
+    def decorator(func: Callable[..., Awaitable[Any]]) -> "_Memoized":
+        if not inspect.iscoroutinefunction(func):
+            raise TypeError("memoize() can only decorate async functions")
+        return _Memoized(func, ttl, maxsize, stale_ttl)
+    return decorator
+
+
+class _Memoized:
+    """An async function wrapped by `memoize`."""
+    def __init__(self, func: Callable[..., Awaitable[Any]], ttl: float, maxsize: int, stale_ttl: float) -> None:
+        functools.update_wrapper(self, func)
+        self.func: Callable[..., Awaitable[Any]] = func
+        self.ttl: float = ttl
+        self.stale_ttl: float = stale_ttl
+        self.cache: _LRUCache = _LRUCache(maxsize)
+        self.hits: int = 0
+        self.stale_hits: int = 0
+        self.misses: int = 0
+        self._pending: Dict[Any, "asyncio.Task[Any]"] = {}
+
+    def __get__(self, instance: Any, owner: Optional[type] = None) -> Any:
+        return self if instance is None else types.MethodType(self, instance)
+
+    async def __call__(self, *args: Any, **kwargs: Any) -> Any:
+        key = (args, tuple(sorted(kwargs.items()))) if kwargs else args
+        try:
+            entry = self.cache.get(key)
+        except TypeError:  # Unhashable arguments can't be cached.
+            self.misses += 1
+            return await self.func(*args, **kwargs)
+        if entry is not None:
+            expires, value = entry
+            now = time.monotonic()
+            if now < expires:
+                self.hits += 1
+                return value
+            if now < expires + self.stale_ttl:
+                self.stale_hits += 1
+                if key not in self._pending:
+                    self._load(key, args, kwargs).add_done_callback(self._report_refresh)
+                return value
+        pending = self._pending.get(key)
+        if pending is not None:  # Share the call already in flight.
+            self.hits += 1
+            return await asyncio.shield(pending)
+        self.misses += 1
+        return await asyncio.shield(self._load(key, args, kwargs))
+
+    def _load(self, key: Any, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> "asyncio.Task[Any]":
+        # The call runs in its own task, so a cancelled caller (e.g. a
+        # client that disconnected) doesn't cancel it for everyone else.
+        task = self._pending[key] = asyncio.get_running_loop().create_task(self._fetch(key, args, kwargs))
+        return task
+
+    async def _fetch(self, key: Any, args: Tuple[Any, ...], kwargs: Dict[str, Any]) -> Any:
+        try:
+            value = await self.func(*args, **kwargs)
+        finally:
+            del self._pending[key]
+        self.cache.set(key, (time.monotonic() + self.ttl, value), 1)
+        return value
+
+    @staticmethod
+    def _report_refresh(task: "asyncio.Task[Any]") -> None:
+        if not task.cancelled() and task.exception() is not None:
+            print(f"Memoized refresh error: {task.exception()}")
+
+    def cache_info(self) -> Dict[str, int]:
+        """Return hit, stale hit and miss counts and the current and maximum size."""
+        return {
+            "hits": self.hits,
+            "stale_hits": self.stale_hits,
+            "misses": self.misses,
+            "size": len(self.cache),
+            "maxsize": self.cache.max_size,
+        }
+
+    def cache_clear(self) -> None:
+        """Drop all cached results and reset the counters."""
+        self.cache.clear()
+        self.hits = self.stale_hits = self.misses = 0
+
+
+class DataLoader:
+    """
+    Batch and cache lookups by key, usually for the length of one request.
+
+    Keys passed to `load` during the same event loop tick are collected
+    and fetched with a single call to `batch_fn`, with duplicates removed.
+    Each result is cached in the loader, so a key is fetched at most once.
+    `batch_fn` is an async function that takes a list of keys and returns
+    either a list of values in the same order or a mapping from key to
+    value (keys missing from the mapping load as `None`). Use
+    `Request.loader()` to get a loader that lives as long as the request.
+    """
+    def __init__(self, batch_fn: Callable[[List[Any]], Awaitable[Any]], max_batch_size: Optional[int] = None) -> None:
+        """
+        Initialize a DataLoader.
+
+        Args:
+            batch_fn: Async function fetching the values for a list of keys.
+            max_batch_size: The most keys passed to one `batch_fn` call, or None.
+        """
+        self.batch_fn: Callable[[List[Any]], Awaitable[Any]] = batch_fn
+        self.max_batch_size: Optional[int] = max_batch_size
+        self._cache: Dict[Any, "asyncio.Future[Any]"] = {}
+        self._queue: List[Tuple[Any, "asyncio.Future[Any]"]] = []
+        self._batches: set = set()
+
+    def _future(self, key: Any) -> "asyncio.Future[Any]":
+        future = self._cache.get(key)
+        if future is None:
+            loop = asyncio.get_running_loop()
+            future = self._cache[key] = loop.create_future()
+            if not self._queue:
+                loop.call_soon(self._dispatch)
+            self._queue.append((key, future))
+        return future
+
+    async def load(self, key: Any) -> Any:
+        """
+        Load the value for one key.
+
+        Args:
+            key: A hashable key passed on to `batch_fn`.
+
+        Returns:
+            The value `batch_fn` returned for the key.
+        """
+        return await asyncio.shield(self._future(key))
+
+    async def load_many(self, keys: Iterable[Any]) -> List[Any]:
+        """
+        Load the values for several keys, in one batch where possible.
+
+        Args:
+            keys: Hashable keys passed on to `batch_fn`.
+
+        Returns:
+            The values, in the order of `keys`.
+        """
+        futures = [self._future(key) for key in keys]
+        return list(await asyncio.shield(asyncio.gather(*futures)))
+
+    def prime(self, key: Any, value: Any) -> None:
+        """Cache `value` for `key` unless the key is already loaded or loading."""
+        if key not in self._cache:
+            future = self._cache[key] = asyncio.get_running_loop().create_future()
+            future.set_result(value)
+
+    def clear(self, *keys: Any) -> None:
+        """Forget the cached values for `keys`, or for every key if none are given."""
+        if not keys:
+            self._cache.clear()
+        for key in keys:
+            self._cache.pop(key, None)
+
+    def _dispatch(self) -> None:
+        queue, self._queue = self._queue, []
+        size = self.max_batch_size or len(queue)
+        loop = asyncio.get_running_loop()
+        for start in range(0, len(queue), size):
+            task = loop.create_task(self._run_batch(queue[start:start + size]))
+            self._batches.add(task)
+            task.add_done_callback(self._batches.discard)
+
+    async def _run_batch(self, batch: List[Tuple[Any, "asyncio.Future[Any]"]]) -> None:
+        keys = [key for key, _ in batch]
+        try:
+            values = await self.batch_fn(keys)
+            if isinstance(values, Mapping):
+                values = [values.get(key) for key in keys]
+            elif len(values) != len(keys):
+                raise ValueError(
+                    f"DataLoader batch function returned {len(values)} values for {len(keys)} keys"
+                )
+        except BaseException as e:
+            for key, future in batch:
+                if self._cache.get(key) is future:
+                    del self._cache[key]  # Let a later load try again.
+                if future.done():
+                    continue
+                if isinstance(e, asyncio.CancelledError):
+                    future.cancel()
+                else:
+                    future.set_exception(e)
+                    future.exception()  # Only waiting callers should see it.
+            if not isinstance(e, Exception):
+                raise
+            return
+        for (_, future), value in zip(batch, values):
+            if not future.done():
+                future.set_result(value)
+
+
+# -----------------------------
+# Compression
+# -----------------------------
+class Compression:
+    """
+    Response compression settings, passed to `App(compression=...)`.
+
+    Responses are compressed with brotli (if the `brotli` package is
+    installed) or gzip, whichever the client's `Accept-Encoding` prefers.
+    Only text-like content types are compressed, and fixed bodies smaller
+    than `minimum_size` are sent as they are. Streaming bodies are
+    compressed chunk by chunk and flushed after every chunk, so streamed
+    data still reaches the client as it is produced. Compressing more than
+    `thread_threshold` bytes at once happens in a worker thread.
+    Compressed fixed bodies are kept in an LRU cache of `cache_size`
+    bytes, unless the response sets a cookie or forbids caching.
+    """
+    COMPRESSIBLE_TYPES: Tuple[str, ...] = (
+        "text/", "application/json", "application/javascript", "application/xml",
+        "application/x-ndjson", "image/svg+xml",
+    )
+
+    def __init__(
+        self,
+        minimum_size: int = 500,
+        gzip_level: int = 6,
+        brotli_quality: int = 4,
+        cache_size: int = 8 * 1024 * 1024,
+        max_cached_body_size: int = 1024 * 1024,
+        thread_threshold: int = 64 * 1024
+    ) -> None:
+        """
+        Configure compression.
+
+        Args:
+            minimum_size: Fixed bodies smaller than this are not compressed.
+            gzip_level: zlib compression level for gzip.
+            brotli_quality: Brotli quality (0-11).
+            cache_size: Total bytes kept in the compressed-response cache.
+            max_cached_body_size: Larger bodies are compressed every time.
+            thread_threshold: Compress in a worker thread above this size.
+        """
+        self.minimum_size: int = minimum_size
+        self.gzip_level: int = gzip_level
+        self.brotli_quality: int = brotli_quality
+        self.max_cached_body_size: int = max_cached_body_size
+        self.thread_threshold: int = thread_threshold
+        self.cache: _LRUCache = _LRUCache(cache_size)
+        self.encodings: Tuple[str, ...] = ("br", "gzip") if BROTLI_INSTALLED else ("gzip",)
+
+    def compressible(self, content_type: bytes) -> bool:
+        """Whether a response with this Content-Type should be compressed."""
+        media_type = content_type.split(b";", 1)[0].strip().lower().decode("latin-1")
+        return media_type.startswith(self.COMPRESSIBLE_TYPES) or media_type.endswith(("+json", "+xml"))
+
+    def choose(self, accept_encoding: Optional[str]) -> Optional[str]:
+        """
+        Pick the content coding to use for a request.
+
+        Args:
+            accept_encoding: The request's Accept-Encoding header.
+
+        Returns:
+            "br", "gzip", or None if the client accepts neither.
+        """
+        if not accept_encoding:
+            return None
+        accepted = _parse_accept_encoding(accept_encoding)
+        wildcard = accepted.get("*", 0.0)
+        best, best_quality = None, 0.0
+        for encoding in self.encodings:
+            quality = accepted.get(encoding, accepted.get("x-gzip", wildcard) if encoding == "gzip" else wildcard)
+            if quality > best_quality:
+                best, best_quality = encoding, quality
+        return best
+
+    def compressor(self, encoding: str) -> Any:
+        """Return a new streaming compressor with `compress(data)` and `flush()`."""
+        if encoding == "br":
+            return _BrotliCompressor(self.brotli_quality)
+        return _GzipCompressor(self.gzip_level)
+
+    async def compress(self, encoding: str, body: Any, cacheable: bool) -> bytes:
+        """
+        Compress a fixed body, using the cache when possible.
+
+        Args:
+            encoding: "br" or "gzip".
+            body: The bytes-like body.
+            cacheable: Whether the result may be cached.
+
+        Returns:
+            The compressed body.
+        """
+        cacheable = cacheable and isinstance(body, bytes) and len(body) <= self.max_cached_body_size
+        if cacheable and (cached := self.cache.get((encoding, body))) is not None:
+            return cached
+        compressor = self.compressor(encoding)
+
+        def run() -> bytes:
+            return compressor.compress(body) + compressor.flush()
+
+        data = await asyncio.to_thread(run) if len(body) > self.thread_threshold else run()
+        if cacheable:
+            self.cache.set((encoding, body), data, len(body) + len(data))
+        return data
+
+    async def compress_stream(self, encoding: str, chunks: AsyncIterator[Any]) -> AsyncIterator[bytes]:
+        """
+        Compress a streaming body chunk by chunk.
+
+        Args:
+            encoding: "br" or "gzip".
+            chunks: The body chunks, as bytes or str.
+
+        Yields:
+            Compressed chunks, each flushed so it can be decoded on arrival.
+        """
+        compressor = self.compressor(encoding)
+        async for chunk in chunks:
+            if isinstance(chunk, str):
+                chunk = chunk.encode("utf-8")
+            if not chunk:
+                continue
+            if len(chunk) > self.thread_threshold:
+                data = await asyncio.to_thread(compressor.compress, chunk, True)
+            else:
+                data = compressor.compress(chunk, True)
+            if data:
+                yield data
+        yield compressor.flush()
+
+
+class _GzipCompressor:
+    __slots__ = ("_zlib",)
+
+    def __init__(self, level: int) -> None:
+        self._zlib = zlib.compressobj(level, zlib.DEFLATED, 31)
+
+    def compress(self, data: Any, flush: bool = False) -> bytes:
+        output = self._zlib.compress(data)
+        return output + self._zlib.flush(zlib.Z_SYNC_FLUSH) if flush else output
+
+    def flush(self) -> bytes:
+        return self._zlib.flush()
+
+
+class _BrotliCompressor:
+    __slots__ = ("_brotli",)
+
+    def __init__(self, quality: int) -> None:
+        self._brotli = brotli.Compressor(quality=quality)
+
+    def compress(self, data: Any, flush: bool = False) -> bytes:
+        output = self._brotli.process(bytes(data))
+        return output + self._brotli.flush() if flush else output
+
+    def flush(self) -> bytes:
+        return self._brotli.finish()
+
+
+# -----------------------------
+# Static Files
+# -----------------------------
+class _StaticFile:
+    """Index entry for one file under a `StaticFiles` directory."""
+    __slots__ = ("path", "stat", "etag", "last_modified", "content_type", "encodings", "digest")
+
+    def __init__(self, path: str, stat: os.stat_result) -> None:
+        self.path: str = path
+        self.stat: os.stat_result = stat
+        self.etag, self.last_modified = _file_validators(stat)
+        content_type, encoding = mimetypes.guess_type(path)
+        if encoding is not None or content_type is None:
+            content_type = "application/octet-stream"
+        elif content_type.startswith("text/") or content_type in ("application/javascript", "application/json"):
+            content_type += "; charset=utf-8"
+        self.content_type: str = content_type
+        # Precompressed siblings (e.g. "app.js.br"), as (coding, entry) pairs in order of preference.
+        self.encodings: List[Tuple[str, "_StaticFile"]] = []
+        # Content hash used in fingerprinted URLs, if fingerprinting is on.
+        self.digest: Optional[str] = None
+
+
+def _file_digest(path: str) -> str:
+    """Return a short content hash of a file, for fingerprinted URLs."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()[:16]
+
+
+def _fingerprinted_name(relative: str, digest: str) -> str:
+    """Insert a content hash before a path's extension: "js/app.js" -> "js/app.<hash>.js"."""
+    directory, _, name = relative.rpartition("/")
+    stem, dot, extension = name.partition(".")
+    name = f"{stem}.{digest}{dot}{extension}" if dot and stem else f"{name}.{digest}"
+    return f"{directory}/{name}" if directory else name
+
+
+class StaticFiles:
+    """
+    Serve the files under a directory at a URL prefix.
+
+    The directory is indexed when the mount is created, so serving a file
+    needs no `stat()` call. Small files are kept in a size-bounded LRU
+    cache and sent straight from memory; larger files and range requests
+    are sent with `FileResponse`. When a file has a `.br` or `.gz` sibling
+    and the client accepts that encoding, the sibling is sent instead.
+
+    With `fingerprint` on, every file is also served at a URL containing a
+    hash of its contents (see `url`), with a `Cache-Control` header that
+    lets browsers cache it for a year without revalidating. A changed
+    file gets a new URL, so deploys still take effect immediately.
+
+    Add mounts to `App.static_files`; they are checked before middleware,
+    sessions and handler dispatch.
+    """
+    ENCODINGS: Tuple[Tuple[str, str], ...] = (("br", ".br"), ("gzip", ".gz"))
+    IMMUTABLE: Tuple[str, str] = ("Cache-Control", "public, max-age=31536000, immutable")
+
+    def __init__(
+        self,
+        directory: str,
+        prefix: str = "/static",
+        max_cache_size: int = 16 * 1024 * 1024,
+        max_cached_file_size: int = 256 * 1024,
+        watch_interval: Optional[float] = None,
+        fingerprint: bool = False
+    ) -> None:
+        """
+        Index the directory and start watching it if asked to.
+
+        Args:
+            directory: The directory to serve.
+            prefix: The URL path the directory is mounted at.
+            max_cache_size: Total bytes of file contents kept in memory.
+            max_cached_file_size: Files up to this size are cached in memory.
+            watch_interval: When set, the directory is re-indexed every
+                this many seconds in a background thread.
+            fingerprint: Hash every file at startup and serve it at a
+                content-hashed URL with immutable cache headers.
+        """
+        self.directory: str = os.path.abspath(directory)
+        self.prefix: str = "/" + prefix.strip("/") if prefix.strip("/") else ""
+        self.max_cached_file_size: int = max_cached_file_size
+        self.fingerprint: bool = fingerprint
+        self.cache: _LRUCache = _LRUCache(max_cache_size)
+        self.index: Dict[str, _StaticFile] = {}
+        # Fingerprinted path -> index entry, and original path -> fingerprinted path.
+        self.fingerprinted: Dict[str, _StaticFile] = {}
+        self.urls: Dict[str, str] = {}
+        self.refresh()
+        self._stop: threading.Event = threading.Event()
+        self._watcher: Optional[threading.Thread] = None
+        if watch_interval:
+            self._watcher = threading.Thread(
+                target=self._watch, args=(watch_interval,), name="micropie-static", daemon=True
+            )
+            self._watcher.start()
+
+    def refresh(self) -> None:
+        """Re-index the directory, picking up added, changed and removed files."""
+        previous = self.index
+        index: Dict[str, _StaticFile] = {}
+        for root, _, names in os.walk(self.directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue
+                relative = os.path.relpath(path, self.directory).replace(os.sep, "/")
+                index[relative] = _StaticFile(path, stat)
+        variants = set()
+        for relative, entry in index.items():
+            for coding, suffix in self.ENCODINGS:
+                if (variant := index.get(relative + suffix)) is not None:
+                    variant.content_type = entry.content_type
+                    entry.encodings.append((coding, variant))
+                    variants.add(relative + suffix)
+        # Precompressed siblings are only sent, with a Content-Encoding, in
+        # place of their original; they are not served under their own names.
+        for relative in variants:
+            del index[relative]
+        fingerprinted: Dict[str, _StaticFile] = {}
+        urls: Dict[str, str] = {}
+        if self.fingerprint:
+            for relative, entry in index.items():
+                old = previous.get(relative)
+                if old is not None and old.etag == entry.etag and old.digest is not None:
+                    entry.digest = old.digest  # Unchanged since the last index: skip rehashing.
+                else:
+                    try:
+                        entry.digest = _file_digest(entry.path)
+                    except OSError:
+                        continue
+                urls[relative] = _fingerprinted_name(relative, entry.digest)
+                fingerprinted[urls[relative]] = entry
+        self.index, self.fingerprinted, self.urls = index, fingerprinted, urls
+
+    def _watch(self, interval: float) -> None:
+        while not self._stop.wait(interval):
+            try:
+                self.refresh()
+            except OSError as e:
+                print(f"Static file index error: {e}")
+
+    def close(self) -> None:
+        """Stop the background watcher, if any."""
+        self._stop.set()
+        if self._watcher is not None:
+            self._watcher.join()
+            self._watcher = None
+
+    def lookup(self, path: str) -> Optional[_StaticFile]:
+        """
+        Find the index entry for a request path.
+
+        Args:
+            path: The request path, e.g. "/static/app.js".
+
+        Returns:
+            The entry, or None if the path isn't a file under this mount.
+        """
+        return self._resolve(path)[0]
+
+    def _resolve(self, path: str) -> Tuple[Optional[_StaticFile], bool]:
+        """Return the entry for a request path, and whether it was a fingerprinted URL."""
+        prefix = self.prefix
+        if not path.startswith(prefix) or path[len(prefix):len(prefix) + 1] != "/":
+            return None, False
+        relative = path[len(prefix) + 1:]
+        if not relative or relative.endswith("/"):
+            relative += "index.html"
+        entry = self.index.get(relative)
+        if entry is None and (entry := self.fingerprinted.get(relative)) is not None:
+            return entry, True
+        return entry, False
+
+    def url(self, path: str) -> str:
+        """
+        Return the URL to link to for a file under this mount.
+
+        Args:
+            path: The file's path relative to the directory, e.g. "js/app.js".
+
+        Returns:
+            The fingerprinted URL if fingerprinting is on and the file
+            exists, otherwise the plain URL.
+        """
+        path = path.lstrip("/")
+        return f"{self.prefix}/{self.urls.get(path, path)}"
+
+    async def respond(self, request: Request) -> Optional[Response]:
+        """
+        Build the response for a request, if it names a file under this mount.
+
+        Args:
+            request: The current request.
+
+        Returns:
+            The response, or None if the request isn't for this mount.
+        """
+        entry, immutable = self._resolve(request.scope["path"])
+        if entry is None:
+            return None
+        headers = request.headers
+        extra: List[Tuple[str, str]] = [self.IMMUTABLE] if immutable else []
+        variant = entry
+        if entry.encodings:
+            extra.append(("Vary", "Accept-Encoding"))
+            if accept := headers.get("accept-encoding"):
+                accepted = _parse_accept_encoding(accept)
+                for coding, candidate in entry.encodings:
+                    if accepted.get(coding, accepted.get("*", 0.0)) > 0:
+                        variant = candidate
+                        extra.append(("Content-Encoding", coding))
+                        break
+        if (if_none_match := headers.get("if-none-match")) and _etag_matches(if_none_match, variant.etag):
+            return Response(b"", 304, [("ETag", variant.etag), *extra])
+        if variant.stat.st_size > self.max_cached_file_size or "range" in headers:
+            return FileResponse(variant.path, headers=extra, content_type=variant.content_type, stat=variant.stat)
+        key = (variant.path, variant.etag, immutable)
+        response = self.cache.get(key)
+        if response is None:
+            try:
+                body = await asyncio.to_thread(_read_file, variant.path)
+            except OSError:
+                return None
+            response = Response(body, headers=[
+                ("ETag", variant.etag),
+                ("Last-Modified", variant.last_modified),
+                ("Accept-Ranges", "bytes"),
+                *extra,
+            ], content_type=variant.content_type)
+            self.cache.set(key, response, len(body))
+        return response
+
+    def __repr__(self) -> str:
+        return f"StaticFiles(directory={self.directory!r}, prefix={self.prefix!r})"
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+# -----------------------------
+# Handler Decorators
+# -----------------------------
+def max_body_size(limit: Optional[int]) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Override the application's `max_body_size` for a single handler.
+
+    Args:
+        limit: The largest request body, in bytes, the handler accepts,
+            or None for no limit.
+
+    Returns:
+        A decorator recording the limit on the handler.
+    """
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        func._micropie_max_body_size = limit
+        return func
+    return decorator
+
+
+def etag(version: Callable[..., Any]) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Give a handler an ETag derived from a version key computed before it runs.
+
+    `version` is called with the same arguments as the handler (including
+    `self`) and returns something that changes whenever the response
+    would, such as a row's `updated_at`. If the request's `If-None-Match`
+    matches, a 304 is sent without calling the handler at all; otherwise
+    the ETag is added to the handler's response. Returning None skips the
+    check. `version` may be sync or async.
+
+    Args:
+        version: Computes the version key for a request.
+
+    Returns:
+        A decorator recording the version function on the handler.
+    """
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        func._micropie_etag_version = version
+        return func
+    return decorator
+
+
+def cache_response(ttl: float, vary: Tuple[str, ...] = ()) -> Callable[[Callable[..., Any]], Callable[..., Any]]:
+    """
+    Cache a handler's responses for anonymous `GET` and `HEAD` requests.
+
+    Responses are cached per method, path, query string and the values of
+    the `vary` request headers, for `ttl` seconds. Cache hits skip body
+    parsing, session loading and the handler. Requests carrying a session
+    cookie always run the handler, and so do requests with an
+    `Authorization` header or any other cookie, unless that header is
+    listed in `vary` (so each credential gets its own cached variant).
+    Only `200` responses with a fixed
+    body that don't set a cookie or forbid caching are stored. Concurrent
+    misses for the same key wait for a single handler call.
+
+    Args:
+        ttl: How long a response stays cached, in seconds.
+        vary: Request headers whose values select between cached variants.
+
+    Returns:
+        A decorator recording the cache policy on the handler.
+    """
+    def decorator(func: Callable[..., Any]) -> Callable[..., Any]:
+        func._micropie_cache = (ttl, tuple(name.lower() for name in vary))
+        return func
+    return decorator
+
+
+def _etag_matches(if_none_match: str, etag: str) -> bool:
+    """
+    Check an `If-None-Match` header against an ETag, using weak comparison.
+
+    Args:
+        if_none_match: The header value.
+        etag: The current ETag.
+
+    Returns:
+        True if the client's copy is current.
+    """
+    if if_none_match.strip() == "*":
+        return True
+    etag = etag[2:] if etag.startswith("W/") else etag
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if (tag[2:] if tag.startswith("W/") else tag) == etag:
+            return True
+    return False
+
+
+def _make_etag(data: bytes) -> str:
+    """Return a strong ETag for some bytes."""
+    return f'"{hashlib.blake2b(data, digest_size=12).hexdigest()}"'
+
+
+# -----------------------------
+# Handler Binding Plans
+# -----------------------------
+_UNSET: Any = object()
+
+class _HttpError(Exception):
+    """Raised internally to short-circuit a request with an error response."""
+    def __init__(self, status_code: int, body: str) -> None:
+        super().__init__(body)
+        self.status_code: int = status_code
+        self.body: str = body
+
+
+_TRUE_VALUES = frozenset(("1", "true", "yes", "on"))
+_FALSE_VALUES = frozenset(("0", "false", "no", "off"))
+
+
+def _to_str(value: Any) -> str:
+    return value if isinstance(value, str) else str(value)
+
+
+def _to_bool(value: Any) -> bool:
+    if isinstance(value, bool):
+        return value
+    lowered = str(value).strip().lower()
+    if lowered in _TRUE_VALUES:
+        return True
+    if lowered in _FALSE_VALUES:
+        return False
+    raise ValueError(f"invalid boolean: {value!r}")
+
+
+def _to_uuid(value: Any) -> uuid.UUID:
+    return value if isinstance(value, uuid.UUID) else uuid.UUID(str(value))
+
+
+def _is_typeddict(annotation: Any) -> bool:
+    return (
+        isinstance(annotation, type)
+        and issubclass(annotation, dict)
+        and hasattr(annotation, "__total__")
+        and hasattr(annotation, "__annotations__")
+    )
+
+
+def _is_model(annotation: Any) -> bool:
+    """Return True for annotations that are filled from a JSON object."""
+    return (
+        isinstance(annotation, type) and dataclasses.is_dataclass(annotation)
+    ) or _is_typeddict(annotation)
+
+
+def _stream_type(annotation: Any) -> Optional[type]:
+    """Return `UploadStream` or `JsonRecords` for annotations read straight from the body."""
+    options = typing.get_args(annotation) if typing.get_origin(annotation) is typing.Union else (annotation,)
+    for option in options:
+        if option is UploadStream or option is JsonRecords:
+            return option
+    return None
+
+
+def _type_hints(obj: Any) -> Dict[str, Any]:
+    """Resolve type hints, falling back to raw annotations when they can't be evaluated."""
+    try:
+        return typing.get_type_hints(obj)
+    except Exception:
+        return dict(getattr(obj, "__annotations__", {}) or {})
+
+
+def _compile_model(annotation: Any) -> Callable[[Any], Any]:
+    """
+    Compile a function that builds a dataclass or TypedDict from a JSON object.
+
+    The field names, converters and required keys are worked out once so
+    that building an instance is a single pass over the declared fields.
+
+    Args:
+        annotation: A dataclass or TypedDict type.
+
+    Returns:
+        A callable taking the decoded JSON object and returning the model.
+    """
+    hints = _type_hints(annotation)
+    if dataclasses.is_dataclass(annotation):
+        fields = [
+            (f.name, _compile_converter(hints.get(f.name, Any)),
+             f.default is dataclasses.MISSING and f.default_factory is dataclasses.MISSING)
+            for f in dataclasses.fields(annotation) if f.init
+        ]
+        factory: Callable[..., Any] = annotation
+    else:
+        required_keys = getattr(annotation, "__required_keys__", frozenset(hints))
+        fields = [
+            (name, _compile_converter(hint), name in required_keys)
+            for name, hint in hints.items()
+        ]
+        factory = dict
+
+    def build(data: Any) -> Any:
+        if not isinstance(data, dict):
+            raise ValueError("expected a JSON object")
+        kwargs: Dict[str, Any] = {}
+        for name, converter, required in fields:
+            if name in data:
+                value = data[name]
+                kwargs[name] = converter(value) if converter is not None else value
+            elif required:
+                raise ValueError(f"missing field '{name}'")
+        return factory(**kwargs)
+
+    return build
+
+
+def _compile_converter(annotation: Any) -> Optional[Callable[[Any], Any]]:
+    """
+    Return the converter for a parameter annotation, or None to pass values through.
+
+    Args:
+        annotation: The resolved type annotation of the parameter.
+
+    Returns:
+        A callable raising `ValueError` or `TypeError` on bad input, or None.
+    """
+    if annotation is str:
+        return _to_str
+    if annotation is bool:
+        return _to_bool
+    if annotation is int or annotation is float:
+        return annotation
+    if annotation is uuid.UUID:
+        return _to_uuid
+    if _is_model(annotation):
+        return _compile_model(annotation)
+    if typing.get_origin(annotation) is typing.Union:
+        args = [arg for arg in typing.get_args(annotation) if arg is not type(None)]
+        if len(args) == 1:
+            inner = _compile_converter(args[0])
+            if inner is not None:
+                return lambda value: None if value is None else inner(value)
+    return None
+
+
+_NO_VALUES: Mapping = types.MappingProxyType({})
+
+# Attribute and global names through which handler code can reach request state.
+_REQUEST_NAMES = frozenset((
+    "request", "current_request", "session", "query_params", "body_params",
+    "files", "get_json", "headers", "cookies",
+))
+
+
+def _may_use_request(handler: Callable[..., Any]) -> bool:
+    """
+    Conservatively decide whether a handler can touch the current request.
+
+    The handler's code (including nested functions and generators, and
+    every function in its `__wrapped__` chain) is scanned once for
+    request-related names and, for bound methods, any use of `self`.
+    Closures, callables that aren't plain functions and anything else
+    that can't be inspected are assumed to use the request.
+
+    Args:
+        handler: The (possibly bound) handler.
+
+    Returns:
+        False only if the handler provably never reaches request state.
+    """
+    func = getattr(handler, "__func__", handler)
+    chain = [func]
+    while hasattr(chain[-1], "__wrapped__"):
+        chain.append(chain[-1].__wrapped__)
+        if len(chain) > 100:
+            return True
+    is_method = inspect.ismethod(handler)
+    for func in chain:
+        if not inspect.isfunction(func) or func.__closure__:
+            return True
+        code = func.__code__
+        self_name = code.co_varnames[0] if is_method and code.co_argcount else None
+        pending = [code]
+        while pending:
+            current = pending.pop()
+            if not _REQUEST_NAMES.isdisjoint(current.co_names):
+                return True
+            if current.co_freevars or current.co_cellvars:
+                return True
+            pending.extend(c for c in current.co_consts if isinstance(c, types.CodeType))
+        if self_name:
+            for instruction in dis.get_instructions(code):
+                if instruction.opname.startswith("LOAD_FAST"):
+                    argval = instruction.argval
+                    if argval == self_name or (isinstance(argval, tuple) and self_name in argval):
+                        return True
+    return False
+
+
+class _Param:
+    """A single handler parameter and where its value is looked up."""
+    __slots__ = ("name", "default", "source", "converter")
+
+    # Sources a parameter value can be bound from.
+    REQUEST = 0   # path segment, then query, body, files, session, default
+    VAR_ARGS = 1  # *args: every remaining path segment
+    SKIP = 2      # **kwargs: nothing is bound
+    MODEL = 3     # dataclass or TypedDict built from the JSON body
+    STREAM = 4    # UploadStream over the part of the same name
+
+    def __init__(
+        self,
+        name: str,
+        default: Any,
+        source: int,
+        converter: Optional[Callable[[Any], Any]] = None
+    ) -> None:
+        self.name: str = name
+        self.default: Any = default
+        self.source: int = source
+        self.converter: Optional[Callable[[Any], Any]] = converter
+
+
+class _BindingPlan:
+    """
+    Precomputed argument-binding information for a handler.
+
+    Built once per handler function so that requests never have to call
+    `inspect.signature` or `inspect.iscoroutinefunction` on the hot path.
+    Type annotations are compiled into per-parameter converters at the
+    same time, and the handler is checked for whether it can reach request
+    state so that unused inputs are never parsed.
+    """
+    __slots__ = (
+        "func", "is_coroutine", "params", "streams", "uses_request", "max_body_size", "etag_version", "cache"
+    )
+
+    def __init__(self, handler: Callable[..., Any]) -> None:
+        """
+        Build the plan for a (possibly bound) handler.
+
+        Args:
+            handler: The handler the plan describes.
+        """
+        self.func: Callable[..., Any] = getattr(handler, "__func__", handler)
+        # Callables such as `@memoize` methods are async through `__wrapped__`.
+        self.is_coroutine: bool = (
+            inspect.iscoroutinefunction(handler) or inspect.iscoroutinefunction(inspect.unwrap(self.func))
+        )
+        hints = _type_hints(self.func)
+        params: List[_Param] = []
+        for param in inspect.signature(handler).parameters.values():
+            annotation = hints.get(param.name, param.annotation)
+            converter = None
+            if param.kind is param.VAR_POSITIONAL:
+                source = _Param.VAR_ARGS
+            elif param.kind is param.VAR_KEYWORD:
+                source = _Param.SKIP
+            elif (stream_type := _stream_type(annotation)) is not None:
+                source = _Param.STREAM
+                converter = None if stream_type is UploadStream else stream_type
+            elif _is_model(annotation):
+                source = _Param.MODEL
+                converter = _compile_model(annotation)
+            else:
+                source = _Param.REQUEST
+                converter = _compile_converter(annotation)
+            params.append(_Param(param.name, param.default, source, converter))
+        self.params: Tuple[_Param, ...] = tuple(params)
+        self.streams: Tuple[str, ...] = tuple(p.name for p in params if p.source == _Param.STREAM)
+        self.uses_request: bool = _may_use_request(handler)
+        self.max_body_size: Optional[int] = getattr(self.func, "_micropie_max_body_size", _UNSET)
+        self.etag_version: Optional[Callable[..., Any]] = getattr(self.func, "_micropie_etag_version", None)
+        self.cache: Optional[Tuple[float, Tuple[str, ...]]] = getattr(self.func, "_micropie_cache", None)
+
+    def needs_body(self, request: "Request") -> bool:
+        """
+        Whether binding may need the request body.
+
+        Args:
+            request: The current request, with path parameters set.
+
+        Returns:
+            True if a parameter can't be bound from the path or query string.
+        """
+        remaining = len(request.path_params)
+        for param in self.params:
+            if param.source == _Param.MODEL:
+                return True
+            if param.source == _Param.REQUEST:
+                if remaining:
+                    remaining -= 1
+                elif param.name not in request.query_params:
+                    return True
+        return False
+
+    def needs_session(self, request: "Request") -> bool:
+        """
+        Whether binding may need the session.
+
+        Args:
+            request: The current request, with path, query and body parsed.
+
+        Returns:
+            True if a parameter can't be bound before the session lookup.
+        """
+        remaining = len(request.path_params)
+        for param in self.params:
+            if param.source == _Param.REQUEST:
+                if remaining:
+                    remaining -= 1
+                    continue
+                name = param.name
+                if (name not in request.query_params
+                        and name not in request.body_params
+                        and name not in (request._files or _NO_VALUES)):
+                    return True
+        return False
+
+    def bind(self, request: "Request", streams: Optional[Dict[str, UploadStream]] = None) -> List[Any]:
+        """
+        Build the positional arguments for a call to the handler.
+
+        Path segments are consumed in order; any left over remain in
+        `request.path_params` for the handler to inspect.
+
+        Args:
+            request: The current request.
+            streams: The upload streams for `UploadStream` and
+                `JsonRecords` parameters.
+
+        Returns:
+            The list of arguments to call the handler with.
+
+        Raises:
+            _HttpError: If a required parameter has no value or a value
+                can't be converted to the parameter's annotated type.
+        """
+        path_params = request.path_params
+        consumed = 0
+        func_args: List[Any] = []
+        empty = inspect.Parameter.empty
+        # Read the underlying containers so binding never allocates empty ones.
+        body_params = request._body_params or _NO_VALUES
+        json_body = request._get_json if request._body_params is None else None
+        if not isinstance(json_body, dict):
+            json_body = _NO_VALUES
+        files = request._files or _NO_VALUES
+        session = request._session or _NO_VALUES
+        for param in self.params:
+            if param.source == _Param.REQUEST:
+                name = param.name
+                if consumed < len(path_params):
+                    value = path_params[consumed]
+                    consumed += 1
+                elif name in request.query_params:
+                    value = request.query_params[name][0]
+                elif name in json_body:
+                    value = json_body[name]
+                elif name in body_params:
+                    value = body_params[name][0]
+                elif name in files:
+                    func_args.append(files[name])
+                    continue
+                elif name in session:
+                    func_args.append(session[name])
+                    continue
+                elif param.default is not empty:
+                    func_args.append(param.default)
+                    continue
+                else:
+                    raise _HttpError(400, f"400 Bad Request: Missing required parameter '{name}'")
+                if param.converter is not None:
+                    try:
+                        value = param.converter(value)
+                    except (TypeError, ValueError):
+                        raise _HttpError(400, f"400 Bad Request: Invalid value for parameter '{name}'")
+                func_args.append(value)
+            elif param.source == _Param.STREAM:
+                stream = streams[param.name] if streams else None
+                if stream is not None and param.converter is not None:
+                    stream = param.converter(stream)
+                func_args.append(stream)
+            elif param.source == _Param.MODEL:
+                try:
+                    func_args.append(param.converter(request.get_json))
+                except (TypeError, ValueError) as e:
+                    raise _HttpError(400, f"400 Bad Request: Invalid body for parameter '{param.name}': {e}")
+            elif param.source == _Param.VAR_ARGS:
+                func_args.extend(path_params[consumed:])
+                consumed = len(path_params)
+        if consumed:
+            request.path_params = path_params[consumed:]
+        return func_args
+
+
+# -----------------------------
+# Middleware Abstraction
+# -----------------------------
+class HttpMiddleware(ABC):
+    """
+    Pluggable middleware class that allows hooking into the request lifecycle.
+    """
+
+    @abstractmethod
+    async def before_request(self, request: Request) -> None:
+        """
+        Called before the request is processed.
+        """
+        pass
+
+    @abstractmethod
+    async def after_request(
+        self,
+        request: Request,
+        status_code: int,
+        response_body: Any,
+        extra_headers: List[Tuple[str, str]]
+    ) -> None:
+        """
+        Called after the request is processed, but before the final response
+        is sent to the client. You may alter the status_code, response_body,
+        or extra_headers if needed.
+        """
+        pass
+
+
+# -----------------------------
+# Application Base
+# -----------------------------
+class App:
+    """
+    ASGI application for handling HTTP requests in MicroPie.
+    It supports pluggable session backends via the 'session_backend' attribute
+    and pluggable middlewares via the 'middlewares' list.
+
+    The URL routes of a subclass are collected once, when the class is
+    defined, into the 'routes' table which maps the first path segment to
+    the name of the handler method serving it.
+    """
+    routes: Dict[str, str] = {}
+    _fallback_route: Optional[str] = None
+
+    def __init_subclass__(cls, **kwargs: Any) -> None:
+        super().__init_subclass__(**kwargs)
+        cls.routes = cls._collect_routes()
+        cls._fallback_route = "index" if "index" in cls.routes else None
+
+    @classmethod
+    def _collect_routes(cls) -> Dict[str, str]:
+        """
+        Build the route table from the public methods of the class.
+
+        Only functions and other callables (such as `@memoize` methods)
+        defined on subclasses of `App` are routed, so attributes such as
+        `request` or the framework's own helpers can never be reached from
+        a URL. Classes are never routed, and names starting with an
+        underscore are private and are never routed.
+
+        Returns:
+            A dictionary mapping a path segment to a handler method name.
+        """
+        routes: Dict[str, str] = {}
+        seen: set = set()
+        for klass in cls.__mro__:
+            if klass is App or klass is object:
+                continue
+            for name, value in vars(klass).items():
+                if name in seen:
+                    continue
+                seen.add(name)
+                if name.startswith("_"):
+                    continue
+                if isinstance(value, (staticmethod, classmethod)) or (callable(value) and not isinstance(value, type)):
+                    routes[name] = name
+        return routes
+
+    def __init__(
+        self,
+        session_backend: Optional[SessionBackend] = None,
+        sync_workers: Optional[int] = None,
+        max_body_size: Optional[int] = None,
+        upload_storage: Optional[UploadStorage] = None,
+        compression: Optional[Compression] = None,
+        etags: bool = False,
+        response_cache_size: int = 32 * 1024 * 1024,
+        template_dir: str = "templates",
+        precompile_templates: bool = False,
+        template_bytecode_dir: Optional[str] = None
+    ) -> None:
+        """
+        Initialize the application.
+
+        Args:
+            session_backend: Session storage, defaults to `InMemorySessionBackend`.
+            sync_workers: When set, synchronous handlers and synchronous
+                generator bodies run in a thread pool of this many workers
+                instead of on the event loop.
+            max_body_size: The largest request body, in bytes, accepted by
+                default. Handlers can override it with `@max_body_size`.
+            upload_storage: Where uploaded files are stored, defaults to
+                `SpooledUploadStorage`.
+            compression: Response compression settings; responses are not
+                compressed unless this is set.
+            etags: Add an ETag to every fixed 200 response and answer
+                matching `If-None-Match` requests with 304.
+            response_cache_size: Total bytes of responses kept for
+                handlers decorated with `@cache_response`.
+            template_dir: The directory Jinja2 templates are loaded from.
+            precompile_templates: Compile every template now and keep it
+                in memory, without checking the files for changes again.
+            template_bytecode_dir: A directory where compiled templates
+                are stored, so other workers and restarts skip compiling.
+        """
+        self._templates: Dict[str, Any] = {}
+        if JINJA_INSTALLED:
+            if template_bytecode_dir:
+                os.makedirs(template_bytecode_dir, exist_ok=True)
+            self.env = Environment(
+                loader=FileSystemLoader(template_dir),
+                autoescape=select_autoescape(["html", "xml"]),
+                enable_async=True,
+                auto_reload=not precompile_templates,
+                bytecode_cache=FileSystemBytecodeCache(template_bytecode_dir) if template_bytecode_dir else None
+            )
+            self.env.globals["static_url"] = self.static_url
+            if precompile_templates:
+                self._precompile_templates()
+        else:
+            self.env = None
+        self.session_backend: SessionBackend = session_backend or InMemorySessionBackend()
+        self.middlewares: List[HttpMiddleware] = []
+        self.static_files: List[StaticFiles] = []
+        self._binding_plans: Dict[str, _BindingPlan] = {}
+        self.max_body_size: Optional[int] = max_body_size
+        self.upload_storage: UploadStorage = upload_storage or SpooledUploadStorage()
+        self.compression: Optional[Compression] = compression
+        self.etags: bool = etags
+        self.response_cache: _LRUCache = _LRUCache(response_cache_size)
+        self._response_flights: Dict[Any, "asyncio.Future[Optional[Response]]"] = {}
+        self.executor: Optional[ThreadPoolExecutor] = None
+        if sync_workers:
+            self.executor = ThreadPoolExecutor(max_workers=sync_workers, thread_name_prefix="micropie")
+        self._executor_lock = threading.Lock()
+        self._executor_queued: int = 0
+
+    @property
+    def executor_queue_depth(self) -> int:
+        """
+        Number of synchronous calls waiting for a free worker thread.
+
+        Returns: Always 0 when no executor is configured.
+        """
+        return self._executor_queued
+
+    async def _run_sync(self, func: Callable[..., Any], *args: Any) -> Any:
+        """
+        Run a synchronous callable, in the executor if one is configured.
+
+        The call runs in a copy of the current context so `self.request`
+        keeps working inside worker threads.
+
+        Args:
+            func: The callable to run.
+            *args: Positional arguments for the callable.
+
+        Returns:
+            Whatever the callable returns.
+        """
+        if self.executor is None:
+            return func(*args)
+        ctx = contextvars.copy_context()
+
+        def run() -> Any:
+            with self._executor_lock:
+                self._executor_queued -= 1
+            return ctx.run(func, *args)
+
+        def done(future: Any) -> None:
+            if future.cancelled():  # Never picked up by a worker.
+                with self._executor_lock:
+                    self._executor_queued -= 1
+
+        with self._executor_lock:
+            self._executor_queued += 1
+        future = self.executor.submit(run)
+        future.add_done_callback(done)
+        return await asyncio.wrap_future(future)
+
+    @property
+    def request(self) -> Request:
+        """
+        Retrieve the current request from the context variable.
+
+        Returns: The current Request instance.
+        """
+        return current_request.get()
+
+    async def __call__(
+        self,
+        scope: Dict[str, Any],
+        receive: Callable[[], Awaitable[Dict[str, Any]]],
+        send: Callable[[Dict[str, Any]], Awaitable[None]]
+    ) -> None:
+        """
+        ASGI callable interface for the server.
+
+        Args:
+            scope: The ASGI scope dictionary.
+            receive: The callable to receive ASGI events.
+            send: The callable to send ASGI events.
+        """
+        if scope["type"] == "http":
+            await self._asgi_app_http(scope, receive, send)
+        else:
+            pass  # Handle websockets, lifespan and more in the future.
+
+    async def _asgi_app_http(
+        self,
+        scope: Dict[str, Any],
+        receive: Callable[[], Awaitable[Dict[str, Any]]],
+        send: Callable[[Dict[str, Any]], Awaitable[None]]
+    ) -> None:
+        """
+        ASGI application entry point for handling HTTP requests.
+
+        Args:
+            scope: The ASGI scope dictionary.
+            receive: The callable to receive ASGI events.
+            send: The callable to send ASGI events.
+        """
+        request: Request = Request(scope)
+        token = current_request.set(request)
+        status_code: int = 200
+        response_body: Any = ""
+        extra_headers: List[Tuple[str, str]] = []
+        cache_key: Any = None
+        flight: Optional["asyncio.Future[Optional[Response]]"] = None
+        try:
+            # Static files skip middleware, sessions and handler dispatch.
+            if self.static_files and request.method in ("GET", "HEAD"):
+                for mount in self.static_files:
+                    if (static := await mount.respond(request)) is not None:
+                        body = static if isinstance(static, FileResponse) else static.body
+                        await self._send_response(send, static.status_code, body, static.headers)
+                        return
+
+            # Middleware: before request
+            for mw in self.middlewares:
+                if result := await mw.before_request(request):
+                    status_code, response_body, extra_headers = (
+                        result["status_code"],
+                        result["body"],
+                        result.get("headers", []),
+                    )
+                    await self._send_response(send, status_code, response_body, extra_headers)
+                    return
+
+            # Parse path and find handler
+            path: str = scope["path"].lstrip("/")
+            parts: List[str] = path.split("/") if path else []
+            func_name: str = parts[0] if parts else "index"
+            route: Optional[str] = self.routes.get(func_name)
+            if route is None and not func_name.startswith("_"):
+                route = self._fallback_route
+            if route is None:
+                await self._send_response(send, 404, "404 Not Found")
+                return
+            request.path_params = parts[1:] if len(parts) > 1 else []
+            handler = getattr(self, route)
+
+            # Only parse what the handler (or a middleware) can actually use.
+            plan = self._get_binding_plan(route, handler)
+            parse_all: bool = plan.uses_request or bool(self.middlewares)
+
+            # Cached responses skip body parsing, sessions and the handler.
+            if plan.cache is not None and self._response_cacheable(request, plan.cache[1]):
+                cache_key = (request.method, scope["path"], route, *self._response_cache_vary(request, plan.cache[1]))
+                cached, flight = await self._lookup_cached_response(cache_key)
+                if cached is not None:
+                    await self._finish_response(send, request, cached.status_code, cached.body, list(cached.headers))
+                    return
+
+            # Parse body parameters, or leave the body to the handler's upload streams.
+            streams: Optional[Dict[str, UploadStream]] = None
+            limit = self.max_body_size if plan.max_body_size is _UNSET else plan.max_body_size
+            try:
+                if plan.streams:
+                    streams = await self._open_upload_streams(request, receive, limit, plan.streams)
+                elif request.method in ("POST", "PUT", "PATCH"):
+                    if parse_all or plan.needs_body(request):
+                        await self._parse_body(request, receive, limit)
+                    else:
+                        request._skipped += ("body",)
+            except _HttpError as e:
+                await self._send_response(send, e.status_code, e.body)
+                return
+
+            session_id: str = request.cookies.get("session_id", "")
+            if session_id:
+                if parse_all or plan.needs_session(request):
+                    request.session = await self.session_backend.load(session_id) or {}
+                else:
+                    request._skipped += ("session",)
+
+            # Build function arguments from path, query, body, files, and session values.
+            try:
+                func_args = plan.bind(request, streams)
+            except _HttpError as e:
+                await self._send_response(send, e.status_code, e.body)
+                return
+
+            if route == "index" and not func_args and path:
+                await self._send_response(send, 404, "404 Not Found")
+                return
+
+            # Execute handler, unless its version key shows the client's copy is current
+            try:
+                if plan.etag_version is not None and (tag := await self._version_etag(plan, func_args)):
+                    if_none_match = request.headers.get("if-none-match")
+                    if if_none_match and _etag_matches(if_none_match, tag):
+                        await self._send_response(send, 304, "", [("ETag", tag)])
+                        return
+                    extra_headers.append(("ETag", tag))
+                if plan.is_coroutine:
+                    result = await handler(*func_args)
+                else:
+                    result = await self._run_sync(handler, *func_args)
+            except _HttpError as e:
+                await self._send_response(send, e.status_code, e.body)
+                return
+            except Exception as e:
+                print(f"Request error: {e}")
+                await self._send_response(send, 500, "500 Internal Server Error")
+                return
+
+            # Normalize response
+            if isinstance(result, tuple):
+                status_code, response_body = result[0], result[1]
+                if len(result) > 2:
+                    extra_headers = [*extra_headers, *result[2]]
+            else:
+                response_body = result
+            if isinstance(response_body, Response):
+                status_code = response_body.status_code
+                extra_headers = [*response_body.headers, *extra_headers]
+                if not isinstance(response_body, FileResponse):
+                    response_body = response_body.body
+            if isinstance(response_body, JsonStream):
+                items = response_body.items
+                if self.executor is not None and not hasattr(items, "__aiter__"):
+                    # Iterators such as database cursors may block, so pull them in the executor.
+                    items = self._iterate_sync(iter(items))
+                extra_headers.append(("Content-Type", response_body.content_type))
+                response_body = response_body.encode(self._json_dumps, items)
+            elif isinstance(response_body, (dict, list)) or (
+                not isinstance(response_body, (str, bytes, FileResponse)) and _model_encoder(type(response_body))
+            ):
+                response_body = self._json_dumps(response_body)
+                extra_headers.append(("Content-Type", "application/json"))
+
+            # Save session (never over a stored session that wasn't loaded)
+            if request._session and "session" not in request._skipped:
+                if not session_id:
+                    session_id = str(uuid.uuid4())
+                    extra_headers.append(("Set-Cookie", f"session_id={session_id}; Path=/; SameSite=Lax"))
+                await self.session_backend.save(session_id, request.session, SESSION_TIMEOUT)
+
+            if cache_key is not None:
+                assert plan.cache is not None
+                if plan.cache[1]:
+                    extra_headers.append(("Vary", ", ".join(plan.cache[1])))
+                cached = self._store_cached_response(cache_key, plan.cache[0], status_code, response_body, extra_headers)
+                if flight is not None:
+                    flight.set_result(cached)
+
+            await self._finish_response(send, request, status_code, response_body, extra_headers)
+
+        finally:
+            if flight is not None:
+                if not flight.done():
+                    flight.set_result(None)
+                if self._response_flights.get(cache_key) is flight:
+                    del self._response_flights[cache_key]
+            if request._files:
+                for upload in request._files.values():
+                    if isinstance(upload, UploadedFile):
+                        await self.upload_storage.cleanup(upload)
+            current_request.reset(token)
+
+    async def _finish_response(
+        self,
+        send: Callable[[Dict[str, Any]], Awaitable[None]],
+        request: Request,
+        status_code: int,
+        response_body: Any,
+        extra_headers: List[Tuple[str, str]]
+    ) -> None:
+        """
+        Run the after-request middlewares and send the response.
+
+        Args:
+            send: The ASGI send callable.
+            request: The current request.
+            status_code: The HTTP status code.
+            response_body: The normalized response body.
+            extra_headers: The response headers.
+        """
+        for mw in self.middlewares:
+            if result := await mw.after_request(request, status_code, response_body, extra_headers):
+                status_code, response_body, extra_headers = (
+                    result.get("status_code", status_code),
+                    result.get("body", response_body),
+                    result.get("headers", extra_headers)
+                )
+        await self._send_response(send, status_code, response_body, extra_headers)
+
+    def _response_cacheable(self, request: Request, vary: Tuple[str, ...]) -> bool:
+        """
+        Whether a request may be answered from, and stored in, the response cache.
+
+        Only anonymous `GET` and `HEAD` requests are: anything carrying a
+        session cookie is not, and neither is anything carrying an
+        `Authorization` header or cookies, unless the handler varies on
+        that header so different credentials never share a response.
+
+        Args:
+            request: The current request.
+            vary: The request headers the cached response varies on.
+
+        Returns:
+            True if the cache may be used.
+        """
+        if request.method not in ("GET", "HEAD") or "session_id" in request.cookies:
+            return False
+        headers = request.headers
+        for name in ("authorization", "cookie"):
+            if name not in vary and name in headers:
+                return False
+        return True
+
+    def _response_cache_vary(self, request: Request, vary: Tuple[str, ...]) -> Tuple[Any, ...]:
+        """
+        Return the parts of a response cache key that depend on the request.
+
+        Args:
+            request: The current request.
+            vary: The request headers the cached response varies on.
+
+        Returns:
+            The normalized (sorted) query string and the `vary` header values.
+        """
+        query = tuple(sorted((name, tuple(values)) for name, values in request.query_params.items()))
+        headers = request.headers
+        return (query, *(headers.get(name, "") for name in vary))
+
+    async def _lookup_cached_response(
+        self, key: Any
+    ) -> Tuple[Optional[Response], Optional["asyncio.Future[Optional[Response]]"]]:
+        """
+        Look up a cached response, waiting for a concurrent miss to finish.
+
+        Args:
+            key: The response cache key.
+
+        Returns:
+            The cached response, if any. On a miss with no other request
+            computing the response, also a future the caller must resolve
+            with the response it produces (or None).
+        """
+        entry = self.response_cache.get(key)
+        if entry is not None:
+            expires, response = entry
+            if expires > time.monotonic():
+                return response, None
+            self.response_cache.pop(key)
+        pending = self._response_flights.get(key)
+        if pending is not None:
+            return await asyncio.shield(pending), None
+        flight = self._response_flights[key] = asyncio.get_running_loop().create_future()
+        return None, flight
+
+    def _store_cached_response(
+        self,
+        key: Any,
+        ttl: float,
+        status_code: int,
+        response_body: Any,
+        extra_headers: List[Tuple[str, str]]
+    ) -> Optional[Response]:
+        """
+        Store a handler's response in the response cache, if it is cacheable.
+
+        Args:
+            key: The response cache key.
+            ttl: How long to keep the response, in seconds.
+            status_code: The HTTP status code.
+            response_body: The normalized response body.
+            extra_headers: The response headers.
+
+        Returns:
+            The cached response, or None if it can't be cached.
+        """
+        if status_code != 200 or not isinstance(response_body, (str, bytes)):
+            return None
+        headers = list(extra_headers)
+        for k, v in headers:
+            name = k.lower() if isinstance(k, str) else k.decode("latin-1").lower()
+            value = v if isinstance(v, str) else v.decode("latin-1")
+            if name == "set-cookie" or (name == "cache-control" and ("no-store" in value or "private" in value)):
+                return None
+        response = Response(response_body, status_code, headers)
+        if self.etags and not any(k.lower() == b"etag" for k, _ in response.headers):
+            response.headers += ((b"ETag", _make_etag(response.body).encode("latin-1")),)
+        self.response_cache.set(key, (time.monotonic() + ttl, response), len(response.body) + 512)
+        return response
+
+    def _get_binding_plan(self, name: str, handler: Callable[..., Any]) -> _BindingPlan:
+        """
+        Return the cached binding plan for a handler, building it on first use.
+
+        The plan is rebuilt whenever the function behind `name` has been
+        replaced at runtime (on the class or on the instance).
+
+        Args:
+            name: The attribute name the handler was resolved from.
+            handler: The resolved handler.
+
+        Returns:
+            The binding plan for the handler.
+        """
+        plan = self._binding_plans.get(name)
+        if plan is None or plan.func is not getattr(handler, "__func__", handler):
+            plan = self._binding_plans[name] = _BindingPlan(handler)
+        return plan
+
+    async def _version_etag(self, plan: _BindingPlan, func_args: List[Any]) -> Optional[str]:
+        """
+        Compute the ETag for a handler decorated with `@etag`.
+
+        Args:
+            plan: The handler's binding plan.
+            func_args: The arguments the handler will be called with.
+
+        Returns:
+            The ETag, or None if the version function returned None.
+        """
+        version_func = plan.etag_version
+        assert version_func is not None
+        if inspect.iscoroutinefunction(version_func):
+            version = await version_func(self, *func_args)
+        else:
+            version = await self._run_sync(version_func, self, *func_args)
+        return None if version is None else _make_etag(repr(version).encode("utf-8"))
+
+    def _json_loads(self, data: Union[bytes, str]) -> Any:
+        """
+        Decode a JSON request body. Override to plug in a different codec.
+
+        Args:
+            data: The raw JSON document.
+
+        Returns:
+            The decoded object.
         """
-        pass
+        return json_loads(data)
 
+    def _json_dumps(self, obj: Any) -> bytes:
+        """
+        Encode a JSON response body. Override to plug in a different codec.
 
-# -----------------------------
-# Application Base
-# -----------------------------
-class App:
-    """
-    ASGI application for handling HTTP requests in MicroPie.
-    It supports pluggable session backends via the 'session_backend' attribute
-    and pluggable middlewares via the 'middlewares' list.
-    """
+        Dataclass and __slots__ objects, at any depth, are encoded with a
+        per-type encoder that is built once and cached.
 
-    def __init__(self, session_backend: Optional[SessionBackend] = None) -> None:
-        if JINJA_INSTALLED:
-            self.env = Environment(
-                loader=FileSystemLoader("templates"),
-                autoescape=select_autoescape(["html", "xml"]),
-                enable_async=True
-            )
-        else:
-            self.env = None
-        self.session_backend: SessionBackend = session_backend or InMemorySessionBackend()
-        self.middlewares: List[HttpMiddleware] = []
+        Args:
+            obj: The object to serialize.
 
-    @property
-    def request(self) -> Request:
+        Returns:
+            The JSON document as bytes.
         """
-        Retrieve the current request from the context variable.
+        return json_dumps(obj, _encode_model)
 
-        Returns: The current Request instance.
+    def _parse_cookies(self, cookie_header: str) -> Dict[str, str]:
         """
-        return current_request.get()
+        Parse the Cookie header and return a dictionary of cookie names and values.
 
-    async def __call__(
+        Args:
+            cookie_header: The raw Cookie header string.
+
+        Returns:
+            A dictionary mapping cookie names to their corresponding values.
+        """
+        return _parse_cookie_header(cookie_header)
+
+    async def _receive_body(
         self,
-        scope: Dict[str, Any],
+        request: Request,
         receive: Callable[[], Awaitable[Dict[str, Any]]],
-        send: Callable[[Dict[str, Any]], Awaitable[None]]
-    ) -> None:
+        limit: Optional[int] = None
+    ) -> AsyncIterator[bytes]:
         """
-        ASGI callable interface for the server.
+        Yield the request body chunk by chunk as it arrives from the server.
+
+        When a limit is given, a declared Content-Length above it is rejected
+        before anything is read, and bytes are counted as they arrive so
+        chunked bodies can't get past it either.
 
         Args:
-            scope: The ASGI scope dictionary.
-            receive: The callable to receive ASGI events.
-            send: The callable to send ASGI events.
+            request: The current request.
+            receive: The ASGI receive callable.
+            limit: The maximum body size in bytes, or None for no limit.
+
+        Yields:
+            Non-empty chunks of the request body.
+
+        Raises:
+            _HttpError: 413 as soon as the body exceeds the limit.
         """
-        if scope["type"] == "http":
-            await self._asgi_app_http(scope, receive, send)
-        else:
-            pass  # Handle websockets, lifespan and more in the future.
+        too_large = _HttpError(413, "413 Payload Too Large")
+        if limit is not None:
+            declared = request.headers.get("content-length")
+            if declared and declared.isdigit() and int(declared) > limit:
+                raise too_large
+        received = 0
+        while True:
+            msg: Dict[str, Any] = await receive()
+            if msg.get("type") == "http.disconnect":
+                raise _HttpError(400, "400 Bad Request: Client disconnected")
+            chunk: bytes = msg.get("body", b"")
+            if chunk:
+                received += len(chunk)
+                if limit is not None and received > limit:
+                    raise too_large
+                yield chunk
+            if not msg.get("more_body"):
+                return
 
-    async def _asgi_app_http(
+    async def _parse_body(
         self,
-        scope: Dict[str, Any],
+        request: Request,
         receive: Callable[[], Awaitable[Dict[str, Any]]],
-        send: Callable[[Dict[str, Any]], Awaitable[None]]
+        limit: Optional[int] = None
     ) -> None:
         """
-        ASGI application entry point for handling HTTP requests.
+        Parse the request body into `body_params`, `get_json` and `files`.
 
-        Args:
-            scope: The ASGI scope dictionary.
-            receive: The callable to receive ASGI events.
-            send: The callable to send ASGI events.
-        """
-        request: Request = Request(scope)
-        token = current_request.set(request)
-        status_code: int = 200
-        response_body: Any = ""
-        extra_headers: List[Tuple[str, str]] = []
-        try:
-            # Middleware: before request
-            for mw in self.middlewares:
-                if result := await mw.before_request(request):
-                    status_code, response_body, extra_headers = (
-                        result["status_code"],
-                        result["body"],
-                        result.get("headers", []),
-                    )
-                    await self._send_response(send, status_code, response_body, extra_headers)
-                    return
+        The body is consumed incrementally: multipart and urlencoded bodies
+        are parsed as chunks arrive instead of being buffered first.
 
-            # Parse path and find handler
-            path: str = scope["path"].lstrip("/")
-            parts: List[str] = path.split("/") if path else []
-            func_name: str = parts[0] if parts else "index"
-            if func_name.startswith("_"):
-                await self._send_response(send, 404, "404 Not Found")
-                return
+        Args:
+            request: The current request.
+            receive: The ASGI receive callable.
+            limit: The maximum body size in bytes, or None for no limit.
 
-            request.path_params = parts[1:] if len(parts) > 1 else []
-            handler = getattr(self, func_name, None) or getattr(self, "index", None)
-            if not handler:
-                await self._send_response(send, 404, "404 Not Found")
-                return
+        Raises:
+            _HttpError: If the body is malformed or too large.
+        """
+        chunks = self._receive_body(request, receive, limit)
+        content_type = request.headers.get("content-type", "")
+        if "application/json" in content_type:
+            body = b"".join([chunk async for chunk in chunks])
+            try:
+                request.get_json = self._json_loads(body)
+            except ValueError:
+                raise _HttpError(400, "400 Bad Request: Bad JSON")
+        elif "multipart/form-data" in content_type:
+            if boundary := re.search(r"boundary=([^;]+)", content_type):
+                request.body_params, request.files = await self._parse_multipart(
+                    chunks, boundary.group(1).strip('"').encode("utf-8")
+                )
+            else:
+                raise _HttpError(400, "400 Bad Request: Missing boundary")
+        else:
+            request.body_params = await self._parse_urlencoded(chunks)
 
-            # Parse request details
-            request.query_params = parse_qs(scope.get("query_string", b"").decode("utf-8", "ignore"))
-            cookies = self._parse_cookies(request.headers.get("cookie", ""))
-            request.session = await self.session_backend.load(cookies.get("session_id", "")) or {}
-
-            # Parse body parameters.
-            if request.method in ("POST", "PUT", "PATCH"):
-                body_data = bytearray()
-                while True:
-                    msg: Dict[str, Any] = await receive()
-                    body_data += msg.get("body", b"")
-                    if not msg.get("more_body"):
-                        break
-                content_type = request.headers.get("content-type", "")
-                if "application/json" in content_type:
-                    try:
-                        request.get_json = json.loads(body_data.decode("utf-8"))
-                        if isinstance(request.get_json, dict):
-                            request.body_params = {k: [str(v)] for k, v in request.get_json.items()}
-                    except:
-                        print(f"Request error: {e}")
-                        await self._send_response(send, 400, "400 Bad Request: Bad JSON")
-                        return
-                elif "multipart/form-data" in content_type:
-                    if boundary := re.search(r"boundary=([^;]+)", content_type):
-                        reader = asyncio.StreamReader()
-                        reader.feed_data(body_data)
-                        reader.feed_eof()
-                        request.body_params, request.files = await self._parse_multipart(reader, boundary.group(1).encode("utf-8"))
-                    else:
-                        await self._send_response(send, 400, "400 Bad Request: Missing boundary")
-                        return
-                else:
-                    request.body_params = parse_qs(body_data.decode("utf-8", "ignore"))
+    async def _open_upload_streams(
+        self,
+        request: Request,
+        receive: Callable[[], Awaitable[Dict[str, Any]]],
+        limit: Optional[int],
+        names: Tuple[str, ...]
+    ) -> Dict[str, UploadStream]:
+        """
+        Create the `UploadStream`s for a handler's stream parameters.
 
-            # Build function arguments from path, query, body, files, and session values.
-            sig = inspect.signature(handler)
-            func_args: List[Any] = []
-            for param in sig.parameters.values():
-                param_value = None
-                if request.path_params:
-                    param_value = request.path_params.pop(0)
-                elif param.name in request.query_params:
-                    param_value = request.query_params[param.name][0]
-                elif param.name in request.body_params:
-                    param_value = request.body_params[param.name][0]
-                elif param.name in request.files:
-                    param_value = request.files[param.name]
-                elif param.name in request.session:
-                    param_value = request.session[param.name]
-                elif param.default is not param.empty:
-                    param_value = param.default
-                else:
-                    status_code = 400
-                    response_body = f"400 Bad Request: Missing required parameter '{param.name}'"
-                    await self._send_response(send, status_code, response_body)
-                    return
-                func_args.append(param_value)
+        For multipart bodies, the parts before the first streamed part are
+        parsed now so they can be bound to the handler's other parameters;
+        everything after it is read only as the handler consumes its streams.
 
-            if handler == getattr(self, "index", None) and not func_args and path:
-                await self._send_response(send, 404, "404 Not Found")
-                return
+        Args:
+            request: The current request.
+            receive: The ASGI receive callable.
+            limit: The maximum body size in bytes, or None for no limit.
+            names: The names of the stream parameters.
 
-            # Execute handler
-            try:
-                result = await handler(*func_args) if inspect.iscoroutinefunction(handler) else handler(*func_args)
-            except Exception as e:
-                print(f"Request error: {e}")
-                await self._send_response(send, 500, "500 Internal Server Error")
-                return
+        Returns:
+            A dictionary mapping parameter names to streams.
+        """
+        content_type = request.headers.get("content-type", "")
+        boundary: Optional[bytes] = None
+        if "multipart/form-data" in content_type:
+            if not (match := re.search(r"boundary=([^;]+)", content_type)):
+                raise _HttpError(400, "400 Bad Request: Missing boundary")
+            boundary = match.group(1).strip('"').encode("utf-8")
+        reader = _MultipartReader(self, request, self._receive_body(request, receive, limit), boundary)
+        await reader.advance(names)
+        return {name: UploadStream(name, reader) for name in names}
+
+    async def _parse_urlencoded(self, chunks: AsyncIterator[bytes]) -> Dict[str, List[str]]:
+        """
+        Incrementally parse an application/x-www-form-urlencoded body.
 
-            # Normalize response
-            if isinstance(result, tuple):
-                status_code, response_body = result[0], result[1]
-                extra_headers = result[2] if len(result) > 2 else []
-            else:
-                response_body = result
-            if isinstance(response_body, (dict, list)):
-                response_body = json.dumps(response_body)
-                extra_headers.append(("Content-Type", "application/json"))
+        Complete `key=value` pairs are parsed as soon as their terminating
+        `&` arrives, so only the pair currently being received is buffered.
 
-            # Save session
-            if request.session:
-                session_id = cookies.get("session_id") or str(uuid.uuid4())
-                await self.session_backend.save(session_id, request.session, SESSION_TIMEOUT)
-                if not cookies.get("session_id"):
-                    extra_headers.append(("Set-Cookie", f"session_id={session_id}; Path=/; SameSite=Lax"))
+        Args:
+            chunks: The request body chunks.
 
-            # Middleware: after request
-            for mw in self.middlewares:
-                if result := await mw.after_request(request, status_code, response_body, extra_headers):
-                    status_code, response_body, extra_headers = (
-                        result.get("status_code", status_code),
-                        result.get("body", response_body),
-                        result.get("headers", extra_headers)
-                    )
+        Returns:
+            A dictionary mapping field names to lists of values.
+        """
+        params: Dict[str, List[str]] = {}
 
-            await self._send_response(send, status_code, response_body, extra_headers)
+        def merge(data: bytes) -> None:
+            for key, values in parse_qs(data.decode("utf-8", "ignore")).items():
+                params.setdefault(key, []).extend(values)
 
-        finally:
-            current_request.reset(token)
+        pending = bytearray()
+        async for chunk in chunks:
+            cut = chunk.rfind(b"&")
+            if cut == -1:
+                pending += chunk
+                continue
+            pending += chunk[:cut]
+            merge(pending)
+            pending = bytearray(chunk[cut + 1:])
+        merge(pending)
+        return params
 
-    def _parse_cookies(self, cookie_header: str) -> Dict[str, str]:
+    async def _multipart_events(self, chunks: AsyncIterator[bytes], boundary: bytes) -> AsyncIterator[Any]:
         """
-        Parse the Cookie header and return a dictionary of cookie names and values.
+        Feed body chunks into the multipart parser and yield its events.
+
+        For each part a `MultipartSegment` is yielded, followed by the part's
+        data as `bytes` chunks and a final `None`. Only one body chunk is held
+        at a time and parsing pauses until the consumer asks for more.
 
         Args:
-            cookie_header: The raw Cookie header string.
+            chunks: The request body chunks.
+            boundary: The multipart boundary.
 
-        Returns:
-            A dictionary mapping cookie names to their corresponding values.
+        Yields:
+            Parser events.
+
+        Raises:
+            _HttpError: If the multipart stream is malformed.
         """
-        cookies: Dict[str, str] = {}
-        if not cookie_header:
-            return cookies
-        for cookie in cookie_header.split(";"):
-            if "=" in cookie:
-                k, v = cookie.strip().split("=", 1)
-                cookies[k] = v
-        return cookies
+        if not MULTIPART_INSTALLED:
+            print("For multipart form data support install 'multipart'.")
+            raise _HttpError(500, "500 Internal Server Error")
+        parser = PushMultipartParser(boundary)
+        try:
+            async for chunk in chunks:
+                for event in parser.parse(chunk):
+                    yield event
+                if parser.closed:
+                    return
+            for event in parser.parse(b""):
+                yield event
+        except MultipartError:
+            raise _HttpError(400, "400 Bad Request: Malformed multipart body")
 
-    async def _parse_multipart(self, reader: asyncio.StreamReader, boundary: bytes):
+    async def _parse_multipart(
+        self,
+        reader: Union[AsyncIterator[bytes], asyncio.StreamReader],
+        boundary: bytes
+    ) -> Tuple[Dict[str, List[str]], Dict[str, Any]]:
         """
         Asynchronously parses a multipart form-data request.
 
         This method processes incoming multipart form-data, handling
-        both text fields and file uploads. It reads data from the provided
-        asyncio stream reader and extracts form values and files,
-        saving uploaded files to a designated directory.
+        both text fields and file uploads. Body chunks are fed to the
+        parser as they arrive, and uploaded files are handed to the
+        application's `upload_storage` as their data is parsed.
 
         Args:
-            reader (asyncio.StreamReader): The stream reader from which
-                to read the multipart data.
+            reader: An async iterator of body chunks (or an
+                asyncio.StreamReader) to read the multipart data from.
             boundary (bytes): The boundary string used to separate form
                 fields in the multipart request.
 
         Returns:
             tuple[dict, dict]: A tuple containing form_data & files.
         """
-        if not MULTIPART_INSTALLED:
-            print("For multipart form data support install 'multipart' and 'aiofiles'.")
-            await self._send_response(send, 500, "500 Internal Server Error")
-            return
-
-        with PushMultipartParser(boundary) as parser:
-            form_data: dict = {}
-            files: dict = {}
-            current_field_name: Optional[str] = None
-            current_filename: Optional[str] = None
-            current_content_type: Optional[str] = None
-            current_file: Optional[aiofiles.threadpool.binary.AsyncBufferedIOBase] = None
-            form_value: str = ""
-            upload_directory: str = "uploads"
-            await aiofiles.os.makedirs(upload_directory, exist_ok=True)
-            while not parser.closed:
-                chunk: bytes = await reader.read(65536)
-                if not chunk:
-                    break
-                for result in parser.parse(chunk):
-                    if isinstance(result, MultipartSegment):
-                        current_field_name = result.name
-                        current_filename = result.filename
-                        current_content_type = None
-                        form_value = ""
-                        for header, value in result.headerlist:
-                            if header.lower() == "content-type":
-                                current_content_type = value
-
-                        if current_filename:
-                            safe_filename: str = f"{uuid.uuid4()}_{current_filename}"
-                            safe_filename = re.sub(r"[^a-zA-Z0-9_.-]", "_", safe_filename)
-                            file_path: str = os.path.join(upload_directory, safe_filename)
-                            current_file = await aiofiles.open(file_path, "wb")
-                        else:
-                            form_data[current_field_name] = ""
-                    elif result:
-                        if current_file:
-                            await current_file.write(result)
-                        else:
-                            form_value += result.decode("utf-8", "ignore")
+        if isinstance(reader, asyncio.StreamReader):
+            reader = self._iterate_stream_reader(reader)
+        form_data: Dict[str, List[str]] = {}
+        files: Dict[str, UploadedFile] = {}
+        current_field_name: Optional[str] = None
+        current_file: Optional[UploadedFile] = None
+        form_value = bytearray()
+        storage = self.upload_storage
+        try:
+            async for result in self._multipart_events(reader, boundary):
+                if isinstance(result, MultipartSegment):
+                    current_field_name = result.name
+                    form_value = bytearray()
+                    if result.filename:
+                        current_file = await storage.open(
+                            result.filename, result.content_type or "application/octet-stream"
+                        )
+                elif result:
+                    if current_file:
+                        await storage.write(current_file, result)
+                    else:
+                        form_value += result
+                else:
+                    if current_file:
+                        await storage.close(current_file)
+                        if current_field_name in files:
+                            await storage.cleanup(files[current_field_name])
+                        files[current_field_name] = current_file
+                        current_file = None
                     else:
-                        if current_file:
-                            await current_file.close()
-                            current_file = None
-                            files[current_field_name] = {
-                                "filename": current_filename,
-                                "content_type": current_content_type or "application/octet-stream",
-                                "saved_path": os.path.join(upload_directory, safe_filename),
-                            }
-                        else:
-                            form_data[current_field_name] = form_value
-            return form_data, files
+                        form_data.setdefault(current_field_name, []).append(form_value.decode("utf-8", "ignore"))
+        except BaseException:
+            # Don't leave partial uploads behind when the body is rejected.
+            if current_file:
+                await storage.cleanup(current_file)
+            for upload in files.values():
+                await storage.cleanup(upload)
+            raise
+        return form_data, files
+
+    async def _iterate_stream_reader(self, reader: asyncio.StreamReader) -> AsyncIterator[bytes]:
+        while chunk := await reader.read(65536):
+            yield chunk
 
     async def _send_response(
         self,
@@ -462,24 +3275,82 @@ class App:
         Args:
             send: The ASGI send callable.
             status_code: The HTTP status code for the response.
-            body: The response body, which may be a string, bytes, or generator.
-            extra_headers: Optional list of extra header tuples.
-        """
-        if extra_headers is None:
-            extra_headers = []
-        sanitized_headers: List[Tuple[str, str]] = []
-        for k, v in extra_headers:
-            if "\n" in k or "\r" in k or "\n" in v or "\r" in v:
-                print(f"Header injection attempt detected: {k}: {v}")
-                continue
-            sanitized_headers.append((k, v))
-        if not any(h[0].lower() == "content-type" for h in sanitized_headers):
-            sanitized_headers.append(("Content-Type", "text/html; charset=utf-8"))
+            body: The response body, which may be a string, a bytes-like
+                object, or a generator. Fixed bodies get a Content-Length.
+            extra_headers: Optional list of extra header tuples, either
+                strings or bytes already encoded by `Response`.
+        """
+        headers: List[Tuple[bytes, bytes]] = []
+        content_type: Optional[bytes] = None
+        etag_value: Optional[bytes] = None
+        has_length = has_encoding = False
+        for k, v in extra_headers or ():
+            if not isinstance(k, bytes):
+                if "\n" in k or "\r" in k or "\n" in v or "\r" in v:
+                    print(f"Header injection attempt detected: {k}: {v}")
+                    continue
+                k, v = k.encode("latin-1"), v.encode("latin-1")
+            # Headers that are already bytes were validated by `Response`.
+            name = k.lower()
+            if name == b"content-type":
+                content_type = v
+            elif name == b"content-length":
+                has_length = True
+            elif name == b"content-encoding":
+                has_encoding = True
+            elif name == b"etag":
+                etag_value = v
+            headers.append((k, v))
+        if isinstance(body, FileResponse):
+            await self._send_file(send, status_code, body, headers)
+            return
+        if content_type is None:
+            headers.append(_DEFAULT_CONTENT_TYPE)
+            content_type = _DEFAULT_CONTENT_TYPE[1]
+        if self.executor is not None and hasattr(body, "__next__") and not isinstance(body, (bytes, str)):
+            # Generators may block between chunks, so pull them in the executor.
+            body = self._iterate_sync(body)
+        if isinstance(body, (bytes, bytearray, memoryview)):
+            fixed: Optional[Any] = body
+        elif isinstance(body, str):
+            fixed = body.encode("utf-8")
+        elif hasattr(body, "__aiter__") or hasattr(body, "__iter__"):
+            fixed = None
+        else:
+            fixed = str(body).encode("utf-8")
+        if self.etags and fixed is not None and status_code == 200:
+            request = current_request.get(None)
+            if request is not None and request.method in ("GET", "HEAD"):
+                if etag_value is None:
+                    etag_value = _make_etag(fixed).encode("latin-1")
+                    headers.append((b"ETag", etag_value))
+                if_none_match = request.headers.get("if-none-match")
+                if if_none_match and _etag_matches(if_none_match, etag_value.decode("latin-1")):
+                    if self.compression is not None and not has_encoding:
+                        # Repeat the ETag and Vary the compressed 200 would have had.
+                        self._prepare_compression(headers, content_type, fixed)
+                    status_code, fixed = 304, b""
+        if self.compression is not None and not has_encoding and status_code not in _NO_BODY_STATUSES:
+            body, fixed, compressed = await self._compress_response(headers, content_type, body, fixed)
+            has_length = has_length and not compressed
+        if fixed is not None and not has_length and status_code not in _NO_BODY_STATUSES:
+            size = fixed.nbytes if isinstance(fixed, memoryview) else len(fixed)
+            headers.append((b"Content-Length", str(size).encode("latin-1")))
         await send({
             "type": "http.response.start",
             "status": status_code,
-            "headers": [(k.encode("latin-1"), v.encode("latin-1")) for k, v in sanitized_headers],
+            "headers": headers,
         })
+        if fixed is not None:
+            request = current_request.get(None)
+            if request is not None and request.method == "HEAD":
+                fixed = b""  # Same headers, including Content-Length, but no body.
+            await send({
+                "type": "http.response.body",
+                "body": fixed,
+                "more_body": False
+            })
+            return
         if hasattr(body, "__aiter__"):
             async for chunk in body:
                 if isinstance(chunk, str):
@@ -489,9 +3360,7 @@ class App:
                     "body": chunk,
                     "more_body": True
                 })
-            await send({"type": "http.response.body", "body": b"", "more_body": False})
-            return
-        if hasattr(body, "__iter__") and not isinstance(body, (bytes, str)):
+        else:
             for chunk in body:
                 if isinstance(chunk, str):
                     chunk = chunk.encode("utf-8")
@@ -500,15 +3369,247 @@ class App:
                     "body": chunk,
                     "more_body": True
                 })
+        await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+    async def _compress_response(
+        self,
+        headers: List[Tuple[bytes, bytes]],
+        content_type: bytes,
+        body: Any,
+        fixed: Optional[Any]
+    ) -> Tuple[Any, Optional[Any], bool]:
+        """
+        Compress a response body if its type, size and the request allow it.
+
+        Adds `Vary` and `Content-Encoding` headers as needed, and removes
+        `Content-Length` and weakens `ETag` when the body is compressed.
+
+        Args:
+            headers: The encoded response headers, updated in place.
+            content_type: The response's Content-Type.
+            body: The response body.
+            fixed: The body as bytes, or None for streaming bodies.
+
+        Returns:
+            The (possibly compressed) body and fixed body, and whether
+            compression was applied.
+        """
+        compression = self.compression
+        assert compression is not None
+        encoding, cacheable = self._prepare_compression(headers, content_type, fixed)
+        if encoding is None:
+            return body, fixed, False
+        headers.append((b"Content-Encoding", encoding.encode("latin-1")))
+        if fixed is not None:
+            fixed = await compression.compress(encoding, fixed, cacheable)
+            return fixed, fixed, True
+        chunks = body if hasattr(body, "__aiter__") else _aiter_sync(body)
+        return compression.compress_stream(encoding, chunks), None, True
+
+    def _prepare_compression(
+        self,
+        headers: List[Tuple[bytes, bytes]],
+        content_type: bytes,
+        fixed: Optional[Any]
+    ) -> Tuple[Optional[str], bool]:
+        """
+        Pick the encoding for a response and update its headers for it.
+
+        Adds `Vary` when the response is compressible, and removes
+        `Content-Length` and weakens `ETag` when an encoding is chosen.
+        Used for compressed responses and for the 304s standing in for them.
+
+        Args:
+            headers: The encoded response headers, updated in place.
+            content_type: The response's Content-Type.
+            fixed: The body as bytes, or None for streaming bodies.
+
+        Returns:
+            The chosen encoding (or None), and whether the compressed body
+            may be cached.
+        """
+        compression = self.compression
+        assert compression is not None
+        if not compression.compressible(content_type):
+            return None, False
+        if fixed is not None and (fixed.nbytes if isinstance(fixed, memoryview) else len(fixed)) < compression.minimum_size:
+            return None, False
+        headers.append((b"Vary", b"Accept-Encoding"))
+        request = current_request.get(None)
+        encoding = compression.choose(request.headers.get("accept-encoding") if request is not None else None)
+        if encoding is None:
+            return None, False
+        cacheable = True
+        updated: List[Tuple[bytes, bytes]] = []
+        for k, v in headers:
+            name = k.lower()
+            if name == b"content-length":
+                continue
+            if name == b"etag" and not v.startswith(b"W/"):
+                v = b"W/" + v
+            elif name == b"set-cookie" or (name == b"cache-control" and (b"no-store" in v or b"private" in v)):
+                cacheable = False
+            updated.append((k, v))
+        headers[:] = updated
+        return encoding, cacheable
+
+    async def _iterate_sync(self, iterator: Any) -> Any:
+        """
+        Asynchronously iterate a synchronous iterator using `_run_sync`.
+
+        Args:
+            iterator: The synchronous iterator to consume.
+
+        Yields:
+            The items produced by the iterator.
+        """
+        done = object()
+        while True:
+            item = await self._run_sync(next, iterator, done)
+            if item is done:
+                return
+            yield item
+
+    async def _send_file(
+        self,
+        send: Callable[[Dict[str, Any]], Awaitable[None]],
+        status_code: int,
+        response: FileResponse,
+        headers: List[Tuple[bytes, bytes]]
+    ) -> None:
+        """
+        Send a `FileResponse`, answering the current request's `Range` header.
+
+        Args:
+            send: The ASGI send callable.
+            status_code: The status code for a full response.
+            response: The file to send.
+            headers: The encoded response headers.
+        """
+        request: Optional[Request] = current_request.get(None)
+        scope: Dict[str, Any] = request.scope if request is not None else {}
+        try:
+            stat = response.stat or await asyncio.to_thread(os.stat, response.path)
+        except OSError:
+            await self._send_response(send, 404, "404 Not Found")
+            return
+        size = stat.st_size
+        etag, last_modified = _file_validators(stat)
+        names = {k.lower() for k, _ in headers}
+        headers.append((b"Accept-Ranges", b"bytes"))
+        if b"etag" not in names:
+            headers.append((b"ETag", etag.encode("latin-1")))
+        if b"last-modified" not in names:
+            headers.append((b"Last-Modified", last_modified.encode("latin-1")))
+
+        ranges: Optional[List[Tuple[int, int]]] = None
+        if status_code == 200 and request is not None and (range_header := request.headers.get("range")):
+            if_range = request.headers.get("if-range")
+            if if_range is None or if_range in (etag, last_modified):
+                ranges = _parse_ranges(range_header, size)
+        if ranges is not None and not ranges:
+            await self._send_response(
+                send, 416, "416 Range Not Satisfiable", [(b"Content-Range", f"bytes */{size}".encode("latin-1"))]
+            )
+            return
+
+        # Each segment is (bytes sent before it, offset, length).
+        segments: List[Tuple[bytes, int, int]] = [(b"", 0, size)]
+        suffix = b""
+        if ranges is not None:
+            status_code = 206
+            if len(ranges) == 1:
+                start, end = ranges[0]
+                segments = [(b"", start, end - start + 1)]
+                headers.append((b"Content-Range", f"bytes {start}-{end}/{size}".encode("latin-1")))
+            else:
+                boundary = uuid.uuid4().hex
+                segments = [
+                    (
+                        (b"\r\n" if i else b"") + (
+                            f"--{boundary}\r\nContent-Type: {response.content_type}\r\n"
+                            f"Content-Range: bytes {start}-{end}/{size}\r\n\r\n"
+                        ).encode("latin-1"),
+                        start,
+                        end - start + 1,
+                    )
+                    for i, (start, end) in enumerate(ranges)
+                ]
+                suffix = f"\r\n--{boundary}--\r\n".encode("latin-1")
+                headers = [(k, v) for k, v in headers if k.lower() != b"content-type"]
+                headers.append((b"Content-Type", f"multipart/byteranges; boundary={boundary}".encode("latin-1")))
+        length = sum(len(prefix) + count for prefix, _, count in segments) + len(suffix)
+        headers.append((b"Content-Length", str(length).encode("latin-1")))
+
+        extensions: Dict[str, Any] = scope.get("extensions") or {}
+        if request is not None and request.method == "HEAD":
+            await send({"type": "http.response.start", "status": status_code, "headers": headers})
             await send({"type": "http.response.body", "body": b"", "more_body": False})
             return
-        response_body = (body if isinstance(body, bytes)
-                 else str(body).encode("utf-8"))
-        await send({
-            "type": "http.response.body",
-            "body": response_body,
-            "more_body": False
-        })
+        if ranges is None and "http.response.pathsend" in extensions:
+            await send({"type": "http.response.start", "status": status_code, "headers": headers})
+            await send({"type": "http.response.pathsend", "path": os.path.abspath(response.path)})
+            return
+        try:
+            file = await asyncio.to_thread(open, response.path, "rb")
+        except OSError:
+            await self._send_response(send, 404, "404 Not Found")
+            return
+        zerocopy = "http.response.zerocopy" in extensions
+        chunk_size = response.chunk_size
+
+        def read_at(offset: int, count: int) -> bytes:
+            file.seek(offset)
+            return file.read(count)
+
+        try:
+            await send({"type": "http.response.start", "status": status_code, "headers": headers})
+            for prefix, offset, count in segments:
+                if prefix:
+                    await send({"type": "http.response.body", "body": prefix, "more_body": True})
+                if zerocopy:
+                    await send({
+                        "type": "http.response.zerocopy",
+                        "file": file,
+                        "offset": offset,
+                        "count": count,
+                        "more_body": True
+                    })
+                    continue
+                while count > 0:
+                    chunk = await asyncio.to_thread(read_at, offset, min(chunk_size, count))
+                    if not chunk:
+                        break
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+                    offset += len(chunk)
+                    count -= len(chunk)
+            await send({"type": "http.response.body", "body": suffix, "more_body": False})
+        finally:
+            file.close()
+
+    def static_url(self, path: str) -> str:
+        """
+        Return the URL for a static file, fingerprinted if its mount is.
+
+        Also available in templates as `static_url`, e.g.
+        `{{ static_url("js/app.js") }}`.
+
+        Args:
+            path: The file's URL (e.g. "/static/js/app.js") or its path
+                relative to a mounted directory (e.g. "js/app.js").
+
+        Returns:
+            The URL to link to.
+        """
+        for mount in self.static_files:
+            prefix = mount.prefix + "/"
+            if path.startswith(prefix):
+                return mount.url(path[len(prefix):])
+        relative = path.lstrip("/")
+        for mount in self.static_files:
+            if relative in mount.index:
+                return mount.url(relative)
+        return path
 
     def _redirect(self, location: str, extra_headers: list = None) -> Tuple[int, str]:
         """
@@ -526,6 +3627,22 @@ class App:
             headers.extend(extra_headers)
         return 302, "", headers
 
+    def _precompile_templates(self) -> int:
+        """
+        Compile every template the environment's loader can list.
+
+        The compiled templates are kept in memory, so rendering them
+        needs no file system access and no worker thread. A template with
+        a syntax error raises here, at startup, instead of on a request.
+
+        Returns:
+            The number of templates compiled.
+        """
+        assert self.env is not None
+        for name in self.env.list_templates():
+            self._templates[name] = self.env.get_template(name)
+        return len(self._templates)
+
     async def _render_template(self, name: str, **kwargs: Any) -> str:
         """
         Render a template asynchronously using Jinja2.
@@ -540,6 +3657,74 @@ class App:
         if not JINJA_INSTALLED:
             print("To use the `_render_template` method install 'jinja2'.")
             return 500, "500 Internal Server Error"
-        assert self.env is not None
-        template = await asyncio.to_thread(self.env.get_template, name)
+        template = await self._get_template(name)
         return await template.render_async(**kwargs)
+
+    async def _stream_template(self, name: str, chunk_size: int = 16 * 1024, **kwargs: Any) -> AsyncIterator[bytes]:
+        """
+        Render a template asynchronously using Jinja2, as a stream.
+
+        The template is looked up before this returns, so a missing
+        template fails before any of the response is sent. The page is
+        then rendered while it is sent, and Jinja's many small pieces of
+        output are joined into chunks of about `chunk_size` bytes.
+
+        Args:
+            name: The name of the template file.
+            chunk_size: The size, in characters, of the chunks sent.
+            **kwargs: Additional keyword arguments for the template.
+
+        Returns:
+            An async iterator of encoded chunks, to return from a handler.
+        """
+        if not JINJA_INSTALLED:
+            print("To use the `_stream_template` method install 'jinja2'.")
+            return 500, "500 Internal Server Error"
+        template = await self._get_template(name)
+        return self._coalesce_template(template.generate_async(**kwargs), chunk_size)
+
+    async def _get_template(self, name: str) -> Any:
+        """
+        Return a compiled template, from memory when templates are precompiled.
+
+        Args:
+            name: The name of the template file.
+
+        Returns:
+            The Jinja2 template.
+        """
+        assert self.env is not None
+        template = self._templates.get(name)
+        if template is None:
+            template = await asyncio.to_thread(self.env.get_template, name)
+            if not self.env.auto_reload:
+                self._templates[name] = template
+        return template
+
+    async def _coalesce_template(self, parts: AsyncIterator[str], chunk_size: int) -> AsyncIterator[bytes]:
+        """
+        Join rendered template output into chunks of about `chunk_size` characters.
+
+        Args:
+            parts: The output of `Template.generate_async`.
+            chunk_size: The size of the chunks yielded.
+
+        Yields:
+            UTF-8 encoded chunks.
+        """
+        buffer: List[str] = []
+        size = 0
+        try:
+            async for part in parts:
+                buffer.append(part)
+                size += len(part)
+                if size >= chunk_size:
+                    yield "".join(buffer).encode("utf-8")
+                    buffer.clear()
+                    size = 0
+            if buffer:
+                yield "".join(buffer).encode("utf-8")
+        finally:
+            aclose = getattr(parts, "aclose", None)
+            if aclose is not None:
+                await aclose()
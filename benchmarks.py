@@ -0,0 +1,100 @@
+"""
+Microbenchmarks for MicroPie internals.
+
+Run with:
+    python benchmarks.py
+"""
+
+import asyncio
+import gc
+import timeit
+import tracemalloc
+from typing import Any, Callable, Dict
+
+from MicroPie import App, JsonStream, Request
+
+
+SCOPE: Dict[str, Any] = {
+    "type": "http",
+    "method": "GET",
+    "path": "/",
+    "query_string": b"",
+    "headers": [
+        (b"host", b"127.0.0.1:8000"),
+        (b"user-agent", b"Mozilla/5.0 (X11; Linux x86_64; rv:128.0) Gecko/20100101 Firefox/128.0"),
+        (b"accept", b"text/html,application/xhtml+xml,application/xml;q=0.9,*/*;q=0.8"),
+        (b"accept-language", b"en-US,en;q=0.5"),
+        (b"accept-encoding", b"gzip, deflate, br, zstd"),
+        (b"connection", b"keep-alive"),
+        (b"upgrade-insecure-requests", b"1"),
+        (b"sec-fetch-dest", b"document"),
+        (b"sec-fetch-mode", b"navigate"),
+        (b"sec-fetch-site", b"none"),
+        (b"sec-fetch-user", b"?1"),
+        (b"priority", b"u=0, i"),
+    ],
+}
+
+
+class EagerRequest:
+    """The previous Request implementation, kept here as a baseline."""
+    def __init__(self, scope: Dict[str, Any]) -> None:
+        self.scope = scope
+        self.method = scope["method"]
+        self.path_params = []
+        self.query_params = {}
+        self.body_params = {}
+        self.get_json = {}
+        self.session = {}
+        self.files = {}
+        self.headers = {
+            k.decode("utf-8", errors="replace").lower(): v.decode("utf-8", errors="replace")
+            for k, v in scope.get("headers", [])
+        }
+
+
+def bench(name: str, func: Callable[[], Any], number: int = 200_000) -> None:
+    gc.collect()
+    seconds = min(timeit.repeat(func, number=number, repeat=5))
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<40} {number / seconds:>12,.0f} ops/s {peak:>8,} B peak")
+
+
+async def _drain(chunks: Any) -> None:
+    async for _ in chunks:
+        pass
+
+
+def bench_memory(name: str, func: Callable[[], Any]) -> None:
+    gc.collect()
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<40} {peak:>21,} B peak")
+
+
+def json_export(rows: int = 200_000) -> None:
+    """Compare peak memory of a buffered JSON response with a JsonStream."""
+    app = App()
+    make_rows = lambda: ({"id": i, "name": f"row {i}", "active": True} for i in range(rows))
+    bench_memory(f"JSON export, {rows:,} rows (list)", lambda: app._json_dumps(list(make_rows())))
+    bench_memory(
+        f"JSON export, {rows:,} rows (JsonStream)",
+        lambda: asyncio.run(_drain(JsonStream(make_rows()).encode(app._json_dumps))),
+    )
+
+
+def main() -> None:
+    bench("Request (eager headers)", lambda: EagerRequest(SCOPE))
+    bench("Request (lazy, slots)", lambda: Request(SCOPE))
+    bench("Request + 1 header (eager)", lambda: EagerRequest(SCOPE).headers.get("accept"))
+    bench("Request + 1 header (lazy, slots)", lambda: Request(SCOPE).headers.get("accept"))
+    json_export()
+
+
+if __name__ == "__main__":
+    main()
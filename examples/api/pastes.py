@@ -1,12 +1,19 @@
+import asyncio
+
 from MicroPie import App
 from pickledb import AsyncPickleDB
-import orjson
 from uuid import uuid4
 
 db = AsyncPickleDB('pastes.db')
 
 
+async def get_pastes(pids):
+    """Fetch several pastes at once; used as a per-request DataLoader batch function."""
+    return await asyncio.gather(*(db.aget(pid) for pid in pids))
+
+
 class PasteApp(App):
+    # Dicts are serialized with orjson automatically when it is installed.
 
     async def paste(self, pid: str = None):
         if self.request.method == "POST":
@@ -14,46 +21,47 @@ class PasteApp(App):
             content = self.request.body_params.get('content')[0]
             pid = str(uuid4())
             await db.aset(pid, content)
-            return orjson.dumps({
+            return {
                 "status": "success",
                 "action": "post",
                 "paste_id": pid,
                 "content": content
-            })
+            }
 
         elif self.request.method == "DELETE":
             await db.aremove(pid)
-            return orjson.dumps({
+            return {
                 "status": "success",
                 "action": "delete",
                 "paste_id": pid
-            })
+            }
 
         elif self.request.method == "GET":
             if pid:
                 paste = await db.aget(pid)
                 if paste is None:
-                    return 404, orjson.dumps({
+                    return 404, {
                         "status": "fail",
                         "error": "Paste not found"
-                    })
-                return orjson.dumps({
+                    }
+                return {
                     "status": "success",
                     "action": "get",
                     "paste_id": pid,
                     "content": paste
-                })
+                }
 
             all_keys = await db.aall()
+            contents = await self.request.loader(get_pastes).load_many(all_keys)
             all_pastes = [{
                 "paste_id": key,
-                "content": await db.aget(key)
-            } for key in all_keys]
-            return 302, orjson.dumps({
+                "content": content
+            } for key, content in zip(all_keys, contents)]
+            return 302, {
                 "status": "success",
                 "action": "get all",
                 "pastes": all_pastes
-            })
+            }
 
 
 app = PasteApp()
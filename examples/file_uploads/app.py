@@ -1,28 +1,14 @@
 """
-This file demonstrates how to use a middleware to check file upload sizes
-before the request body is processed by the multipart parser.
+This file demonstrates how to limit upload sizes. MicroPie counts request
+body bytes as they arrive and answers with a 413 as soon as the limit is
+passed, so chunked uploads without a Content-Length are limited too.
 """
 
-from MicroPie import App, HttpMiddleware
+import os
 
-MAX_UPLOAD_SIZE = 100 * 1024 * 1024  # 100MB
-
-class MaxUploadSizeMiddleware(HttpMiddleware):
-    async def before_request(self, request):
-        # Check if we're dealing with a POST, PUT, or PATCH request
-        if request.method in ("POST", "PUT", "PATCH"):
-            content_length = request.headers.get("content-length")
-            # Make sure the file is not too large
-            if int(content_length) > MAX_UPLOAD_SIZE:
-                return {
-                    "status_code": 413,
-                    "body": "413 Payload Too Large: Uploaded file exceeds size limit."
-                }
-        # If the check passes, return None to continue processing.
-        return None
+from MicroPie import App, max_body_size
 
-    async def after_request(self, request, status_code, response_body, extra_headers):
-        return None
+MAX_UPLOAD_SIZE = 100 * 1024 * 1024  # 100MB
 
 
 class FileUploadApp(App):
@@ -36,14 +22,23 @@ class FileUploadApp(App):
         <input type="file" name="file"><br><br>
         <input type="submit" value="Upload">
     </form>
+    <h2>Upload an Avatar (max 1MB)</h2>
+    <form action="/avatar" method="post" enctype="multipart/form-data">
+        <input type="file" name="file"><br><br>
+        <input type="submit" value="Upload">
+    </form>
 </body>
 </html>"""
 
     async def upload(self, file):
-        filename = file["filename"]
-        saved_path = file["saved_path"]
-        return f"File '{filename}' uploaded successfully, saved to: {saved_path}!"
+        # Uploads are deleted after the request unless they are saved or kept.
+        os.makedirs("uploads", exist_ok=True)
+        saved_path = await file.save(os.path.join("uploads", os.path.basename(file.filename)))
+        return f"File '{file.filename}' uploaded successfully, saved to: {saved_path}!"
+
+    @max_body_size(1024 * 1024)  # Per-handler override of the app-wide limit
+    async def avatar(self, file):
+        return f"Avatar '{file.filename}' ({file.size} bytes) uploaded successfully!"
 
 
-app = FileUploadApp()
-app.middlewares.insert(0, MaxUploadSizeMiddleware())
+app = FileUploadApp(max_body_size=MAX_UPLOAD_SIZE)
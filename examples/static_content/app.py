@@ -1,12 +1,12 @@
-from servestatic import ServeStaticASGI
-from MicroPie import App
+from MicroPie import App, StaticFiles
 
 class Root(App):
     async def index(self):
-        return "Hello, World!"
+        return '<img src="/static/logo.png"> Hello, World!'
 
 # Create the application
-application = Root()
+app = Root()
 
-# Wrap it with ServeStaticASGI for static file serving
-app = ServeStaticASGI(application, root="static")
+# Serve the files in ./static at /static. Pass watch_interval=1.0 to pick up
+# files added or changed while the server is running.
+app.static_files.append(StaticFiles("static", "/static"))
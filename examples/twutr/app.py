@@ -9,7 +9,7 @@ from datetime import datetime, timedelta
 from typing import List, Tuple, Optional, Dict, Any
 
 from markupsafe import escape, Markup
-from MicroPie import App, SessionBackend
+from MicroPie import App, DataLoader, SessionBackend, cache_response, memoize
 
 import motor.motor_asyncio
 from motor.motor_asyncio import AsyncIOMotorCollection
@@ -109,6 +109,15 @@ async def get_user_data(username: str) -> Optional[Dict[str, Any]]:
     return found_doc if found_doc else None
 
 
+async def get_users_data(usernames: List[str]) -> Dict[str, Dict[str, Any]]:
+    """
+    Retrieve the data of several users in one query, keyed by username.
+    Used as the batch function of a per-request DataLoader.
+    """
+    cursor = user_collection.find({'username': {'$in': usernames}})
+    return {user_data['username']: user_data async for user_data in cursor}
+
+
 async def save_user_data(username: str, data: Dict[str, Any]) -> None:
     """
     Save updated user data back to the database with upsert.
@@ -128,20 +137,21 @@ def sort_messages_by_timestamp(messages: List[Tuple[str, str, str]],
     )
 
 
-async def get_all_messages_for_user_and_following(user_id: str) -> List[Tuple[str, str, str]]:
+async def get_all_messages_for_user_and_following(user_id: str, users: DataLoader) -> List[Tuple[str, str, str]]:
     """
     Retrieve messages for the given user and the users they follow.
+    All followed users are fetched with one query through the `users` loader.
     """
     all_messages: List[Tuple[str, str, str]] = []
-    user_data = await get_user_data(user_id)
+    user_data = await users.load(user_id)
     if user_data:
         for message in user_data.get('messages', []):
             all_messages.append((user_id, message[0], message[1]))
-        for following in user_data.get('following', []):
-            followed_user_data = await get_user_data(following)
+        following = user_data.get('following', [])
+        for followed, followed_user_data in zip(following, await users.load_many(following)):
             if followed_user_data:
                 for message in followed_user_data.get('messages', []):
-                    all_messages.append((following, message[0], message[1]))
+                    all_messages.append((followed, message[0], message[1]))
     return all_messages
 
 
@@ -179,9 +189,11 @@ async def update_follow_relationship(current_user: str, target_username: str, fo
         await save_user_data(target_username, target_user_data)
 
 
+@memoize(ttl=2, stale_ttl=30)
 async def get_most_recent_messages(user_collection: AsyncIOMotorCollection, limit: int = 200) -> List[Tuple[str, str, str]]:
     """
     Retrieve the most recent messages using an aggregation pipeline.
+    The result is reused for 2 seconds, then refreshed in the background.
     """
     pipeline = [
         {"$match": {"messages": {"$exists": True, "$ne": []}}},
@@ -241,18 +253,21 @@ class Twutr(App):
     async def index(self) -> Any:
         """
         Shows the user's timeline, combining their messages and those from followed users.
+        The page is streamed, so the browser gets the header while messages render.
         """
         if not self.request.session.get('logged_in'):
             return self._redirect('/public')
         user_id = self.request.session.get('user_id')
-        messages = await get_all_messages_for_user_and_following(user_id)
+        messages = await get_all_messages_for_user_and_following(user_id, self.request.loader(get_users_data))
         messages = sort_messages_by_timestamp(messages, timestamp_index=2)
-        return await self._render_template('timeline.html', messages=messages, session=self.request.session)
+        return await self._stream_template('timeline.html', messages=messages, session=self.request.session)
 
 
+    @cache_response(ttl=5)
     async def public(self) -> Any:
         """
-        Displays the latest messages from all users.
+        Displays the latest messages from all users. Anonymous visitors share
+        one rendering for up to 5 seconds; logged in users always get a fresh one.
         """
         messages = await get_most_recent_messages(user_collection, limit=200)
         messages = sort_messages_by_timestamp(messages, timestamp_index=2)
@@ -1,29 +1,66 @@
 import asyncio
+import dataclasses
+import functools
+import gzip
 import json
 import os
+import shutil
 import tempfile
+import threading
 import time
 import uuid
-from typing import Any, Dict, List, Tuple
+import zlib
+from typing import Any, Dict, List, Optional, Tuple
 from unittest.mock import AsyncMock, MagicMock, patch
 
-import aiofiles
 import unittest
 
+import MicroPie
 from MicroPie import (
     App,
+    cache_response,
+    Compression,
+    DataLoader,
+    etag,
+    max_body_size,
+    memoize,
     HttpMiddleware,
     InMemorySessionBackend,
+    JsonRecords,
+    JsonStream,
     JINJA_INSTALLED,
     MULTIPART_INSTALLED,
+    FileResponse,
     Request,
+    Response,
     SESSION_TIMEOUT,
+    SpooledUploadStorage,
+    StaticFiles,
+    UploadStream,
+    UploadedFile,
     current_request,
 )
 
 # ---------------------------------------------------------------------
 # Helper Classes & Functions for ASGI Simulation
 # ---------------------------------------------------------------------
+def _touch_session():
+    current_request.get().session["visits"] = 1
+    return "ok"
+
+
+def _read_body():
+    return str(current_request.get().body_params)
+
+
+async def _index_via_helper():
+    return _touch_session()
+
+
+async def _echo_via_helper():
+    return _read_body()
+
+
 class SendCollector:
     """A helper asynchronous callable that collects ASGI sent messages."""
     def __init__(self):
@@ -129,6 +166,21 @@ class TestMicroPie(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(request.session, {})
         self.assertEqual(request.files, {})
 
+    def test_request_headers_view(self):
+        """Test the lazy, case-insensitive, multi-value header view."""
+        scope = {"method": "GET", "headers": [
+            (b"accept", b"text/html"), (b"X-Tag", b"a"), (b"x-tag", b"b"),
+            (b"cookie", b"a=1"), (b"cookie", b"b=2"),
+        ]}
+        request = Request(scope)
+        self.assertEqual(request.headers["X-TAG"], "a")
+        self.assertEqual(request.headers.getlist("x-tag"), ["a", "b"])
+        self.assertEqual(request.headers.get("missing", "none"), "none")
+        self.assertIn("Accept", request.headers)
+        self.assertEqual(list(request.headers), ["accept", "x-tag", "cookie"])
+        self.assertEqual(request.cookies, {"a": "1", "b": "2"})
+        self.assertIs(request.headers.raw, scope["headers"])
+
     # -----------------------------
     # Middleware Tests
     # -----------------------------
@@ -189,6 +241,52 @@ class TestMicroPie(unittest.IsolatedAsyncioTestCase):
             result = asyncio.run(self.app._render_template("test.html", value="123"))
             self.assertEqual(result, "Value: 123")
 
+    @unittest.skipUnless(JINJA_INSTALLED, "Jinja2 is not installed")
+    def test_precompile_templates(self):
+        """Test templates are compiled at startup, rendered without threads and cached as bytecode."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            templates = os.path.join(tmpdir, "templates")
+            bytecode = os.path.join(tmpdir, "cache", "bytecode")
+            os.makedirs(os.path.join(templates, "partials"))
+            with open(os.path.join(templates, "page.html"), "w", encoding="utf-8") as f:
+                f.write("{% include 'partials/nav.html' %}Value: {{ value }}")
+            with open(os.path.join(templates, "partials", "nav.html"), "w", encoding="utf-8") as f:
+                f.write("<nav></nav>")
+            app = TestApp(template_dir=templates, precompile_templates=True, template_bytecode_dir=bytecode)
+            self.assertEqual(sorted(app._templates), ["page.html", "partials/nav.html"])
+            self.assertEqual(len(os.listdir(bytecode)), 2)
+            with patch("MicroPie.asyncio.to_thread") as to_thread:
+                result = asyncio.run(app._render_template("page.html", value="<b>"))
+            to_thread.assert_not_called()
+            self.assertEqual(result, "<nav></nav>Value: &lt;b&gt;")
+            warm = TestApp(template_dir=templates, template_bytecode_dir=bytecode)
+            with patch.object(warm.env, "_compile", side_effect=AssertionError("recompiled")):
+                self.assertEqual(asyncio.run(warm._render_template("page.html", value=1)), "<nav></nav>Value: 1")
+
+    @unittest.skipUnless(JINJA_INSTALLED, "Jinja2 is not installed")
+    def test_stream_template(self):
+        """Test streamed templates match the rendered page and are sent in coalesced chunks."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            with open(os.path.join(tmpdir, "list.html"), "w", encoding="utf-8") as f:
+                f.write("<ul>{% for item in items %}<li>{{ item }}</li>{% endfor %}</ul>")
+            items = [f"item {i} \u00e9" for i in range(500)]
+
+            class StreamApp(App):
+                async def list(self):
+                    return await self._stream_template("list.html", chunk_size=1024, items=items)
+            app = StreamApp(template_dir=tmpdir)
+            send = SendCollector()
+            scope = {"type": "http", "method": "GET", "path": "/list", "headers": [], "query_string": b""}
+            asyncio.run(app(scope, create_receive([{"body": b"", "more_body": False}]), send))
+            chunks = [msg["body"] for msg in send.messages if msg["type"] == "http.response.body"]
+            expected = asyncio.run(app._render_template("list.html", items=items)).encode("utf-8")
+            self.assertEqual(b"".join(chunks), expected)
+            self.assertTrue(all(len(chunk) < 1100 for chunk in chunks))
+            self.assertLess(len(chunks), 25)
+            from jinja2 import TemplateNotFound
+            with self.assertRaises(TemplateNotFound):
+                asyncio.run(app._stream_template("missing.html"))
+
     # -----------------------------
     # Asynchronous App Tests
     # -----------------------------
@@ -217,6 +315,23 @@ class TestMicroPie(unittest.IsolatedAsyncioTestCase):
         body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
         self.assertEqual(body.decode("utf-8"), "404 Not Found")
 
+    def test_route_table(self):
+        """Test the route table only exposes public handler methods."""
+        self.assertEqual(
+            TestApp.routes,
+            {name: name for name in ("index", "hello", "echo", "require_param", "raise_exception")},
+        )
+        self.assertEqual(App.routes, {})
+
+    async def test_asgi_non_handler_attribute_404(self):
+        """Test public non-handler attributes are not routable."""
+        self.app.index = lambda: "index"
+        for path in ("/request", "/middlewares", "/_redirect"):
+            send = SendCollector()
+            self.scope["path"] = path
+            await self.app(self.scope, self.receive, send)
+            self.assertEqual(send.messages[0]["status"], 404)
+
     async def test_asgi_query_params(self):
         """Test handling of query parameters."""
         self.scope["query_string"] = b"name=John&age=30"
@@ -227,6 +342,52 @@ class TestMicroPie(unittest.IsolatedAsyncioTestCase):
         body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
         self.assertEqual(body.decode("utf-8"), "Hello, John, age 30!")
 
+    async def test_asgi_annotated_param_conversion(self):
+        """Test query values are converted using handler annotations."""
+        self.scope["query_string"] = b"age=30&ratio=0.5&admin=yes&uid=12345678-1234-5678-1234-567812345678"
+        async def index(age: int, ratio: float, admin: bool, uid: uuid.UUID, note: Optional[int] = None):
+            return repr((age, ratio, admin, uid.int, note))
+        self.app.index = index
+        await self.app(self.scope, self.receive, self.send_collector)
+        body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
+        expected = (30, 0.5, True, uuid.UUID("12345678-1234-5678-1234-567812345678").int, None)
+        self.assertEqual(body.decode("utf-8"), repr(expected))
+
+    async def test_asgi_annotated_param_bad_value(self):
+        """Test an unconvertible value returns 400 without calling the handler."""
+        self.scope["query_string"] = b"age=thirty"
+        index = AsyncMock(return_value="called")
+        async def handler(age: int):
+            return await index(age)
+        self.app.index = handler
+        await self.app(self.scope, self.receive, self.send_collector)
+        self.assertEqual(self.send_collector.messages[0]["status"], 400)
+        body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
+        self.assertIn("Invalid value for parameter 'age'", body.decode("utf-8"))
+        index.assert_not_called()
+
+    async def test_asgi_dataclass_param_from_json(self):
+        """Test dataclass parameters are built from the JSON body."""
+        @dataclasses.dataclass
+        class Point:
+            x: int
+            y: int
+            label: str = "origin"
+        async def index(point: Point):
+            return repr(point)
+        self.app.index = index
+        self.scope["method"] = "POST"
+        self.scope["headers"] = [(b"content-type", b"application/json")]
+        self.receive = create_receive([{"body": b'{"x": 1, "y": "2"}', "more_body": False}])
+        await self.app(self.scope, self.receive, self.send_collector)
+        body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
+        self.assertEqual(body.decode("utf-8"), repr(Point(1, 2)))
+
+        send = SendCollector()
+        self.receive = create_receive([{"body": b'{"x": 1}', "more_body": False}])
+        await self.app(self.scope, self.receive, send)
+        self.assertEqual(send.messages[0]["status"], 400)
+
     async def test_asgi_json_body(self):
         """Test handling of JSON body in POST request."""
         self.scope["method"] = "POST"
@@ -237,6 +398,585 @@ class TestMicroPie(unittest.IsolatedAsyncioTestCase):
         body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
         self.assertEqual(body.decode("utf-8"), "hello John")
 
+    async def test_asgi_json_values_not_stringified(self):
+        """Test JSON body values keep their types in body_params and bound arguments."""
+        self.scope["method"] = "POST"
+        self.scope["headers"] = [(b"content-type", b"application/json")]
+        self.receive = create_receive([{"body": b'{"count": 3, "tags": ["a"]}', "more_body": False}])
+        async def index(count, tags):
+            return {"count": count + 1, "tags": tags, "params": self.app.request.body_params}
+        self.app.index = index
+        await self.app(self.scope, self.receive, self.send_collector)
+        start = self.send_collector.messages[0]
+        self.assertIn((b"Content-Type", b"application/json"), start["headers"])
+        body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
+        self.assertEqual(json.loads(body), {"count": 4, "tags": ["a"], "params": {"count": [3], "tags": [["a"]]}})
+
+    async def test_asgi_response_models(self):
+        """Test dataclass and __slots__ responses are encoded with cached per-type encoders."""
+        @dataclasses.dataclass
+        class Tag:
+            name: str
+        class Row:
+            __slots__ = ("id", "tag", "_secret")
+            def __init__(self, id, tag):
+                self.id, self.tag, self._secret = id, tag, "hidden"
+        async def index():
+            return [Row(1, Tag("a")), Row(2, Tag("b"))]
+        self.app.index = index
+        stdlib = lambda obj, default=None: json.dumps(obj, default=default).encode("utf-8")
+        for dumps in (MicroPie.json_dumps, stdlib):
+            send = SendCollector()
+            with patch("MicroPie.json_dumps", dumps):
+                await self.app(self.scope, self.receive, send)
+            self.assertIn((b"Content-Type", b"application/json"), send.messages[0]["headers"])
+            body = b"".join(msg["body"] for msg in send.messages if msg["type"] == "http.response.body")
+            self.assertEqual(json.loads(body), [{"id": 1, "tag": {"name": "a"}}, {"id": 2, "tag": {"name": "b"}}])
+        self.assertIn(Row, MicroPie._MODEL_ENCODERS)
+
+        async def single():
+            return Tag("solo")
+        self.app.index = single
+        await self.app(self.scope, self.receive, self.send_collector)
+        body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
+        self.assertEqual(json.loads(body), {"name": "solo"})
+
+    async def test_asgi_json_stream(self):
+        """Test JsonStream sends JSON arrays and NDJSON in coalesced chunks."""
+        async def rows():
+            for i in range(5):
+                yield {"id": i}
+        async def index(fmt=None):
+            if fmt == "ndjson":
+                return JsonStream(({"id": i} for i in range(3)), ndjson=True)
+            return JsonStream(rows(), chunk_size=16)
+        self.app.index = index
+        await self.app(self.scope, self.receive, self.send_collector)
+        self.assertIn((b"Content-Type", b"application/json"), self.send_collector.messages[0]["headers"])
+        chunks = [msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body"]
+        self.assertGreater(len(chunks), 2)
+        self.assertEqual(json.loads(b"".join(chunks)), [{"id": i} for i in range(5)])
+
+        send = SendCollector()
+        self.scope["query_string"] = b"fmt=ndjson"
+        await self.app(self.scope, self.receive, send)
+        self.assertIn((b"Content-Type", b"application/x-ndjson"), send.messages[0]["headers"])
+        body = b"".join(msg["body"] for msg in send.messages if msg["type"] == "http.response.body")
+        self.assertTrue(body.endswith(b"\n"))
+        self.assertEqual([json.loads(line) for line in body.splitlines()], [{"id": i} for i in range(3)])
+
+    async def test_asgi_json_stream_empty(self):
+        """Test an empty JsonStream is a valid empty array."""
+        async def index():
+            return JsonStream([])
+        self.app.index = index
+        await self.app(self.scope, self.receive, self.send_collector)
+        body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
+        self.assertEqual(body, b"[]")
+
+    async def test_asgi_response_object(self):
+        """Test Response objects are reusable and their bodies are sent without copying."""
+        payload = bytearray(b"x" * 10)
+        cached = Response(memoryview(payload), 201, [("X-Cache", "hit")], content_type="text/plain")
+        async def index():
+            return cached
+        self.app.index = index
+        for _ in range(2):
+            send = SendCollector()
+            await self.app(self.scope, self.receive, send)
+            start, body = send.messages
+            self.assertEqual(start["status"], 201)
+            self.assertEqual(start["headers"], [
+                (b"X-Cache", b"hit"), (b"Content-Type", b"text/plain"), (b"Content-Length", b"10"),
+            ])
+            self.assertIs(body["body"].obj, payload)
+        with self.assertRaises(ValueError):
+            Response("", headers=[("X-Bad", "a\r\nSet-Cookie: x=1")])
+
+    async def test_asgi_content_length(self):
+        """Test fixed bodies get a Content-Length and streamed ones don't."""
+        await self.app(self.scope, self.receive, self.send_collector)
+        self.assertIn((b"Content-Length", b"13"), self.send_collector.messages[0]["headers"])
+        self.assertEqual(self.send_collector.messages[1]["body"], b"index handler")
+        async def index():
+            yield "a"
+        self.app.index = index
+        send = SendCollector()
+        await self.app(self.scope, self.receive, send)
+        self.assertNotIn(b"Content-Length", [k for k, _ in send.messages[0]["headers"]])
+
+    async def _get_file(self, headers=(), extensions=None):
+        with tempfile.NamedTemporaryFile(delete=False, suffix=".txt") as f:
+            f.write(b"0123456789")
+        self.addCleanup(os.remove, f.name)
+        async def index():
+            return FileResponse(f.name)
+        self.app.index = index
+        scope = dict(self.scope, headers=list(headers))
+        if extensions is not None:
+            scope["extensions"] = extensions
+        send = SendCollector()
+        await self.app(scope, self.receive, send)
+        return send.messages, f.name
+
+    async def test_asgi_file_response(self):
+        """Test FileResponse sends whole files and single byte ranges."""
+        messages, _ = await self._get_file()
+        headers = dict(messages[0]["headers"])
+        self.assertEqual(messages[0]["status"], 200)
+        self.assertEqual(headers[b"Content-Type"], b"text/plain")
+        self.assertEqual(headers[b"Content-Length"], b"10")
+        self.assertEqual(headers[b"Accept-Ranges"], b"bytes")
+        self.assertEqual(b"".join(m.get("body", b"") for m in messages[1:]), b"0123456789")
+
+        for range_header, expected, content_range in (
+            (b"bytes=2-4", b"234", b"bytes 2-4/10"),
+            (b"bytes=7-", b"789", b"bytes 7-9/10"),
+            (b"bytes=-3", b"789", b"bytes 7-9/10"),
+            (b"bytes=8-100", b"89", b"bytes 8-9/10"),
+        ):
+            messages, _ = await self._get_file([(b"range", range_header)])
+            headers = dict(messages[0]["headers"])
+            self.assertEqual(messages[0]["status"], 206)
+            self.assertEqual(headers[b"Content-Range"], content_range)
+            self.assertEqual(headers[b"Content-Length"], str(len(expected)).encode())
+            self.assertEqual(b"".join(m.get("body", b"") for m in messages[1:]), expected)
+
+        messages, _ = await self._get_file([(b"range", b"bytes=20-30")])
+        self.assertEqual(messages[0]["status"], 416)
+        self.assertIn((b"Content-Range", b"bytes */10"), messages[0]["headers"])
+
+        messages, _ = await self._get_file([(b"range", b"bytes=2-4"), (b"if-range", b'"stale"')])
+        self.assertEqual(messages[0]["status"], 200)
+
+    async def test_asgi_file_response_multiple_ranges(self):
+        """Test several ranges are sent as multipart/byteranges."""
+        messages, _ = await self._get_file([(b"range", b"bytes=0-1, 5-6")])
+        headers = dict(messages[0]["headers"])
+        self.assertEqual(messages[0]["status"], 206)
+        boundary = headers[b"Content-Type"].split(b"boundary=")[1]
+        body = b"".join(m.get("body", b"") for m in messages[1:])
+        self.assertEqual(int(headers[b"Content-Length"]), len(body))
+        self.assertEqual(body, (
+            b"--" + boundary + b"\r\nContent-Type: text/plain\r\nContent-Range: bytes 0-1/10\r\n\r\n01"
+            b"\r\n--" + boundary + b"\r\nContent-Type: text/plain\r\nContent-Range: bytes 5-6/10\r\n\r\n56"
+            b"\r\n--" + boundary + b"--\r\n"
+        ))
+
+    async def test_asgi_file_response_extensions(self):
+        """Test FileResponse uses the pathsend and zerocopy extensions when offered."""
+        messages, path = await self._get_file(extensions={"http.response.pathsend": {}})
+        self.assertEqual(messages[1], {"type": "http.response.pathsend", "path": os.path.abspath(path)})
+
+        messages, _ = await self._get_file([(b"range", b"bytes=3-5")], {"http.response.zerocopy": {}})
+        zerocopy = messages[1]
+        self.assertEqual(zerocopy["type"], "http.response.zerocopy")
+        self.assertEqual((zerocopy["offset"], zerocopy["count"]), (3, 3))
+        self.assertTrue(zerocopy["file"].closed)
+
+    def _static_dir(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        os.makedirs(os.path.join(directory, "js"))
+        for name, data in (("hello.txt", b"hello"), ("big.bin", b"b" * 100), ("js/app.js", b"plain"), ("js/app.js.br", b"brotli")):
+            with open(os.path.join(directory, name), "wb") as f:
+                f.write(data)
+        return directory
+
+    async def _get_static(self, path, headers=()):
+        send = SendCollector()
+        scope = dict(self.scope, path=path, headers=list(headers))
+        await self.app(scope, self.receive, send)
+        body = b"".join(m.get("body", b"") for m in send.messages[1:])
+        return send.messages[0]["status"], dict(send.messages[0]["headers"]), body
+
+    async def test_asgi_static_files(self):
+        """Test static files are served from the index and small files are cached."""
+        static = StaticFiles(self._static_dir(), "/assets", max_cached_file_size=10)
+        self.app.static_files.append(static)
+        self.app.middlewares.append(self.TestMiddleware())
+        with patch("MicroPie._read_file", wraps=MicroPie._read_file) as read_file:
+            for _ in range(2):
+                status, headers, body = await self._get_static("/assets/hello.txt")
+                self.assertEqual((status, body), (200, b"hello"))
+            self.assertEqual(read_file.call_count, 1)
+        self.assertEqual(headers[b"Content-Type"], b"text/plain; charset=utf-8")
+        self.assertEqual(headers[b"Content-Length"], b"5")
+        self.assertNotIn(b"X-Test", headers)
+        self.assertNotIn(b"Set-Cookie", headers)
+
+        status, _, _ = await self._get_static("/assets/hello.txt", [(b"if-none-match", headers[b"ETag"])])
+        self.assertEqual(status, 304)
+
+        self.scope["method"] = "HEAD"
+        status, head_headers, body = await self._get_static("/assets/hello.txt")
+        self.assertEqual((status, body, head_headers), (200, b"", headers))
+        self.scope["method"] = "GET"
+
+        status, headers, body = await self._get_static("/assets/big.bin", [(b"range", b"bytes=0-1")])
+        self.assertEqual((status, body), (206, b"bb"))
+
+        status, _, body = await self._get_static("/assets/missing.txt")
+        self.assertEqual(status, 404)
+
+    async def test_asgi_static_files_precompressed(self):
+        """Test precompressed siblings are sent when the client accepts them."""
+        self.app.static_files.append(StaticFiles(self._static_dir(), "/assets"))
+        status, headers, body = await self._get_static("/assets/js/app.js", [(b"accept-encoding", b"gzip, br")])
+        self.assertEqual(body, b"brotli")
+        self.assertEqual(headers[b"Content-Encoding"], b"br")
+        self.assertEqual(headers[b"Vary"], b"Accept-Encoding")
+        self.assertIn(b"javascript", headers[b"Content-Type"])
+        status, headers, body = await self._get_static("/assets/js/app.js", [(b"accept-encoding", b"br;q=0")])
+        self.assertEqual(body, b"plain")
+        self.assertNotIn(b"Content-Encoding", headers)
+        status, _, _ = await self._get_static("/assets/js/app.js.br", [(b"accept-encoding", b"br")])
+        self.assertEqual(status, 404)
+
+    async def test_asgi_static_files_fingerprinted(self):
+        """Test fingerprinted URLs are served with immutable cache headers."""
+        directory = self._static_dir()
+        self.app.static_files.append(StaticFiles(directory, "/assets", fingerprint=True))
+        url = self.app.static_url("js/app.js")
+        self.assertRegex(url, r"^/assets/js/app\.[0-9a-f]{16}\.js$")
+        self.assertEqual(self.app.static_url("/assets/js/app.js"), url)
+        self.assertEqual(self.app.static_url("/other/app.js"), "/other/app.js")
+        if JINJA_INSTALLED:
+            template = self.app.env.from_string('{{ static_url("hello.txt") }}')
+            self.assertEqual(await template.render_async(), self.app.static_url("hello.txt"))
+
+        status, headers, body = await self._get_static(url, [(b"accept-encoding", b"br")])
+        self.assertEqual((status, body), (200, b"brotli"))
+        self.assertEqual(headers[b"Cache-Control"], b"public, max-age=31536000, immutable")
+        status, headers, body = await self._get_static("/assets/js/app.js")
+        self.assertEqual((status, body), (200, b"plain"))
+        self.assertNotIn(b"Cache-Control", headers)
+
+        with open(os.path.join(directory, "js/app.js"), "wb") as f:
+            f.write(b"changed")
+        os.utime(os.path.join(directory, "js/app.js"), ns=(0, 10 ** 9))
+        self.app.static_files[0].refresh()
+        self.assertNotEqual(self.app.static_url("js/app.js"), url)
+
+    def test_static_files_refresh(self):
+        """Test the index picks up new files on refresh and from the watcher."""
+        directory = self._static_dir()
+        static = StaticFiles(directory, watch_interval=0.01)
+        self.addCleanup(static.close)
+        self.assertIsNone(static.lookup("/static/new.txt"))
+        with open(os.path.join(directory, "new.txt"), "wb") as f:
+            f.write(b"new")
+        deadline = time.monotonic() + 2
+        while static.lookup("/static/new.txt") is None and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertEqual(static.lookup("/static/new.txt").stat.st_size, 3)
+        self.assertIsNone(static.lookup("/static/../new.txt"))
+
+    async def _get_compressed(self, app, accept=b"gzip, br;q=0"):
+        send = SendCollector()
+        scope = dict(self.scope, headers=[(b"accept-encoding", accept)] if accept else [])
+        await app(scope, self.receive, send)
+        body = b"".join(m.get("body", b"") for m in send.messages[1:])
+        return dict(send.messages[0]["headers"]), body, send.messages
+
+    async def test_asgi_compression(self):
+        """Test fixed bodies are gzip-compressed once and served from the cache."""
+        app = TestApp(compression=Compression(minimum_size=100))
+        text = "compress me " * 50
+        async def index(kind="text"):
+            if kind == "small":
+                return "tiny"
+            if kind == "image":
+                return 200, b"x" * 1000, [("Content-Type", "image/png")]
+            return text
+        app.index = index
+        with patch.object(app.compression, "compressor", wraps=app.compression.compressor) as compressor:
+            for _ in range(2):
+                headers, body, _ = await self._get_compressed(app)
+                self.assertEqual(headers[b"Content-Encoding"], b"gzip")
+                self.assertEqual(headers[b"Vary"], b"Accept-Encoding")
+                self.assertEqual(int(headers[b"Content-Length"]), len(body))
+                self.assertEqual(gzip.decompress(body).decode(), text)
+            self.assertEqual(compressor.call_count, 1)
+
+        headers, body, _ = await self._get_compressed(app, None)
+        self.assertEqual(body.decode(), text)
+        self.assertNotIn(b"Content-Encoding", headers)
+        self.assertEqual(headers[b"Vary"], b"Accept-Encoding")
+        for kind in ("small", "image"):
+            self.scope["query_string"] = f"kind={kind}".encode()
+            headers, _, _ = await self._get_compressed(app)
+            self.assertNotIn(b"Content-Encoding", headers)
+
+    async def test_asgi_compression_streaming(self):
+        """Test streaming bodies are compressed chunk by chunk."""
+        app = TestApp(compression=Compression())
+        async def index():
+            for i in range(3):
+                yield f"chunk {i}\n"
+        app.index = index
+        headers, body, messages = await self._get_compressed(app)
+        self.assertEqual(headers[b"Content-Encoding"], b"gzip")
+        self.assertNotIn(b"Content-Length", headers)
+        decompressor = zlib.decompressobj(31)
+        # Every chunk is flushed, so it can be decoded as soon as it arrives.
+        self.assertEqual(decompressor.decompress(messages[1]["body"]), b"chunk 0\n")
+        self.assertEqual(gzip.decompress(body), b"chunk 0\nchunk 1\nchunk 2\n")
+
+    @unittest.skipUnless(MicroPie.BROTLI_INSTALLED, "brotli is not installed")
+    async def test_asgi_compression_brotli(self):
+        """Test brotli is preferred when the client accepts it."""
+        import brotli
+        app = TestApp(compression=Compression(minimum_size=0))
+        async def index():
+            return {"key": "value"}
+        app.index = index
+        headers, body, _ = await self._get_compressed(app, b"gzip, deflate, br")
+        self.assertEqual(headers[b"Content-Encoding"], b"br")
+        self.assertEqual(json.loads(brotli.decompress(body)), {"key": "value"})
+
+    async def test_asgi_automatic_etags(self):
+        """Test fixed responses get an ETag and matching requests a bodiless 304."""
+        app = TestApp(etags=True, compression=Compression(minimum_size=0))
+        async def index():
+            return "same page"
+        app.index = index
+        send = SendCollector()
+        await app(self.scope, self.receive, send)
+        tag = dict(send.messages[0]["headers"])[b"ETag"]
+        self.assertRegex(tag, rb'^"[0-9a-f]{24}"$')
+
+        send = SendCollector()
+        await app(dict(self.scope, headers=[(b"if-none-match", b"W/" + tag), (b"accept-encoding", b"gzip")]), self.receive, send)
+        self.assertEqual(send.messages[0]["status"], 304)
+        self.assertEqual(send.messages[1]["body"], b"")
+        self.assertNotIn(b"Content-Length", dict(send.messages[0]["headers"]))
+
+        send = SendCollector()
+        await app(dict(self.scope, headers=[(b"accept-encoding", b"gzip")]), self.receive, send)
+        ok_headers = dict(send.messages[0]["headers"])
+        self.assertEqual(ok_headers[b"ETag"], b"W/" + tag)
+        self.assertEqual(ok_headers[b"Vary"], b"Accept-Encoding")
+
+        send = SendCollector()
+        await app(dict(self.scope, headers=[(b"if-none-match", ok_headers[b"ETag"]), (b"accept-encoding", b"gzip")]), self.receive, send)
+        not_modified = dict(send.messages[0]["headers"])
+        self.assertEqual(send.messages[0]["status"], 304)
+        self.assertEqual((not_modified[b"ETag"], not_modified[b"Vary"]), (ok_headers[b"ETag"], ok_headers[b"Vary"]))
+        self.assertNotIn(b"Content-Encoding", not_modified)
+
+    async def test_asgi_etag_version(self):
+        """Test @etag version keys skip the handler for up-to-date clients."""
+        calls = []
+        class VersionApp(App):
+            def _post_version(self, post_id):
+                return ("post", post_id, 7)
+            @etag(_post_version)
+            async def post(self, post_id):
+                calls.append(post_id)
+                return 200, f"post {post_id}", [("Cache-Control", "no-cache")]
+        app = VersionApp()
+        scope = dict(self.scope, path="/post/1")
+        send = SendCollector()
+        await app(scope, self.receive, send)
+        headers = dict(send.messages[0]["headers"])
+        self.assertEqual(send.messages[1]["body"], b"post 1")
+        self.assertIn(b"Cache-Control", headers)
+
+        send = SendCollector()
+        await app(dict(scope, headers=[(b"if-none-match", headers[b"ETag"])]), self.receive, send)
+        self.assertEqual(send.messages[0]["status"], 304)
+        self.assertEqual(calls, ["1"])
+
+        send = SendCollector()
+        await app(dict(scope, path="/post/2", headers=[(b"if-none-match", headers[b"ETag"])]), self.receive, send)
+        self.assertEqual(send.messages[0]["status"], 200)
+        self.assertEqual(calls, ["1", "2"])
+
+    async def test_asgi_response_cache(self):
+        """Test cached responses skip the handler until they expire."""
+        calls = []
+        class CachedApp(App):
+            @cache_response(ttl=60, vary=("Accept-Language",))
+            async def public(self, page: int = 1):
+                calls.append(page)
+                return f"page {page} render {len(calls)}"
+        app = CachedApp()
+
+        async def get(query=b"", headers=()):
+            send = SendCollector()
+            await app(dict(self.scope, path="/public", query_string=query, headers=list(headers)), self.receive, send)
+            return send.messages[1]["body"], dict(send.messages[0]["headers"])
+
+        body, headers = await get(b"page=2&x=1")
+        self.assertEqual(body, b"page 2 render 1")
+        self.assertEqual(headers[b"Vary"], b"accept-language")
+        self.assertEqual((await get(b"x=1&page=2"))[0], b"page 2 render 1")
+        self.assertEqual((await get(b"page=2&x=1", [(b"accept-language", b"fr")]))[0], b"page 2 render 2")
+        self.assertEqual((await get(b"page=2&x=1", [(b"cookie", b"session_id=abc")]))[0], b"page 2 render 3")
+
+        with patch("MicroPie.time.monotonic", return_value=time.monotonic() + 61):
+            self.assertEqual((await get(b"page=2&x=1"))[0], b"page 2 render 4")
+
+    async def test_asgi_response_cache_credentials(self):
+        """Test requests with credentials bypass the cache unless the handler varies on them."""
+        calls = []
+        class CachedApp(App):
+            @cache_response(ttl=60)
+            async def me(self):
+                calls.append("me")
+                return f"hello {self.request.headers.get('authorization') or self.request.cookies.get('user')}"
+
+            @cache_response(ttl=60, vary=("Authorization",))
+            async def profile(self):
+                calls.append("profile")
+                return f"profile {self.request.headers.get('authorization')}"
+        app = CachedApp()
+
+        async def get(path, header):
+            send = SendCollector()
+            await app(dict(self.scope, path=path, headers=[header]), self.receive, send)
+            return send.messages[1]["body"]
+
+        self.assertEqual(await get("/me", (b"authorization", b"alice-token")), b"hello alice-token")
+        self.assertEqual(await get("/me", (b"authorization", b"bob-token")), b"hello bob-token")
+        self.assertEqual(await get("/me", (b"cookie", b"user=carol")), b"hello carol")
+        self.assertEqual(await get("/me", (b"cookie", b"user=dave")), b"hello dave")
+        self.assertEqual(calls, ["me"] * 4)
+        for _ in range(2):
+            self.assertEqual(await get("/profile", (b"authorization", b"alice-token")), b"profile alice-token")
+            self.assertEqual(await get("/profile", (b"authorization", b"bob-token")), b"profile bob-token")
+        self.assertEqual(calls.count("profile"), 2)
+
+    async def test_asgi_response_cache_single_flight(self):
+        """Test concurrent misses for the same key run the handler once."""
+        calls = []
+        release = asyncio.Event()
+        class CachedApp(App):
+            @cache_response(ttl=60)
+            async def slow(self):
+                calls.append(1)
+                await release.wait()
+                return "done"
+        app = CachedApp()
+        sends = [SendCollector() for _ in range(5)]
+        tasks = [asyncio.create_task(app(dict(self.scope, path="/slow"), self.receive, s)) for s in sends]
+        await asyncio.sleep(0.01)
+        release.set()
+        await asyncio.gather(*tasks)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual([s.messages[1]["body"] for s in sends], [b"done"] * 5)
+
+    async def test_memoize(self):
+        """Test memoize caches by arguments, coalesces calls and evicts least recently used."""
+        calls = []
+        @memoize(ttl=60, maxsize=2)
+        async def lookup(key, suffix=""):
+            calls.append(key)
+            await asyncio.sleep(0)
+            return key + suffix
+        results = await asyncio.gather(*(lookup("a") for _ in range(3)))
+        self.assertEqual(results, ["a"] * 3)
+        self.assertEqual(await lookup("a"), "a")
+        self.assertEqual(await lookup("a", suffix="!"), "a!")
+        self.assertEqual(await lookup("b"), "b")
+        self.assertEqual(await lookup("a"), "a")
+        self.assertEqual(calls, ["a", "a", "b", "a"])
+        self.assertEqual(lookup.cache_info(), {"hits": 3, "stale_hits": 0, "misses": 4, "size": 2, "maxsize": 2})
+
+        class Service:
+            @memoize()
+            async def profile(self, name):
+                calls.append(name)
+                return {"name": name}
+        service = Service()
+        self.assertIs(await service.profile("x"), await service.profile("x"))
+        self.assertEqual(Service.profile.cache_info()["hits"], 1)
+        with self.assertRaises(TypeError):
+            memoize()(lambda: None)
+
+    async def test_memoize_cancelled_caller(self):
+        """Test cancelling the first caller doesn't cancel the shared call for the others."""
+        release = asyncio.Event()
+        @memoize()
+        async def slow():
+            await release.wait()
+            return "done"
+        first = asyncio.ensure_future(slow())
+        second = asyncio.ensure_future(slow())
+        await asyncio.sleep(0)
+        first.cancel()
+        await asyncio.sleep(0)
+        release.set()
+        self.assertEqual(await second, "done")
+        with self.assertRaises(asyncio.CancelledError):
+            await first
+        self.assertEqual(await slow(), "done")
+        self.assertEqual(slow.cache_info()["misses"], 1)
+
+    async def test_memoize_stale_while_revalidate(self):
+        """Test expired results are served while a refresh runs in the background."""
+        version = [0]
+        @memoize(ttl=10, stale_ttl=30)
+        async def config():
+            version[0] += 1
+            return version[0]
+        self.assertEqual(await config(), 1)
+        now = time.monotonic()
+        with patch("MicroPie.time.monotonic", return_value=now + 15):
+            self.assertEqual(await config(), 1)
+            for _ in range(3):
+                await asyncio.sleep(0)
+            self.assertEqual(await config(), 2)
+        with patch("MicroPie.time.monotonic", return_value=now + 100):
+            self.assertEqual(await config(), 3)
+        self.assertEqual(config.cache_info()["stale_hits"], 1)
+
+    async def test_data_loader(self):
+        """Test DataLoader batches and dedupes keys loaded in the same tick and caches results."""
+        batches = []
+        async def load_users(keys):
+            batches.append(keys)
+            return {key: key.upper() for key in keys if key != "ghost"}
+        loader = DataLoader(load_users)
+        results = await asyncio.gather(loader.load("a"), loader.load("b"), loader.load("a"), loader.load("ghost"))
+        self.assertEqual(results, ["A", "B", "A", None])
+        self.assertEqual(await loader.load_many(["b", "c", "c"]), ["B", "C", "C"])
+        self.assertEqual(batches, [["a", "b", "ghost"], ["c"]])
+
+        request = Request(self.scope)
+        self.assertIs(request.loader(load_users), request.loader(load_users))
+        self.assertIsNot(request.loader(load_users), Request(self.scope).loader(load_users))
+
+        attempts = []
+        async def flaky(keys):
+            attempts.append(keys)
+            if len(attempts) == 1:
+                raise RuntimeError("down")
+            return keys
+        loader = DataLoader(flaky, max_batch_size=2)
+        with self.assertRaises(RuntimeError):
+            await loader.load_many([1, 2])
+        self.assertEqual(await loader.load_many([1, 2, 3]), [1, 2, 3])
+        self.assertEqual(attempts, [[1, 2], [1, 2], [3]])
+        async def short(keys):
+            return keys[:1]
+        with self.assertRaises(ValueError):
+            await DataLoader(short).load_many([1, 2])
+
+    async def test_json_codec_hook(self):
+        """Test subclasses can replace the JSON codec."""
+        class CodecApp(TestApp):
+            def _json_dumps(self, obj):
+                return b"custom"
+        app = CodecApp()
+        async def index():
+            return {"a": 1}
+        app.index = index
+        await app(self.scope, self.receive, self.send_collector)
+        body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
+        self.assertEqual(body, b"custom")
+
     async def test_asgi_post_urlencoded(self):
         """Test handling of URL-encoded POST data."""
         self.scope["method"] = "POST"
@@ -248,8 +988,7 @@ class TestMicroPie(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(body.decode("utf-8"), "1 2")
 
     @patch("MicroPie.MULTIPART_INSTALLED", True)
-    @patch("aiofiles.open", new_callable=AsyncMock)
-    async def test_asgi_multipart_form(self, mock_aiofiles_open):
+    async def test_asgi_multipart_form(self):
         """Test handling of multipart form-data with file upload."""
         self.scope["method"] = "POST"
         self.scope["path"] = "/index"
@@ -267,16 +1006,244 @@ class TestMicroPie(unittest.IsolatedAsyncioTestCase):
             ),
             "more_body": False
         }])
-        mock_file = AsyncMock()
-        mock_aiofiles_open.return_value.__aenter__.return_value = mock_file
+        uploads = []
         async def index(text: str, file: Dict[str, Any]):
+            uploads.append((file, await file.read()))
             return f"Text: {text}, File: {file['filename']}"
         self.app.index = index
         await self.app(self.scope, self.receive, self.send_collector)
         body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
-        # Current behavior truncates text to "h" and doesn't write file
-        self.assertEqual(body.decode("utf-8"), "Text: h, File: test.txt")
-        self.assertFalse(mock_file.write.called, "File write was unexpectedly called")
+        self.assertEqual(body.decode("utf-8"), "Text: hello, File: test.txt")
+        (upload, data), = uploads
+        self.assertIsInstance(upload, UploadedFile)
+        self.assertEqual((upload.content_type, upload.size, data), ("text/plain", 12, b"file content"))
+        self.assertIsNone(upload.path, "Small uploads should stay in memory")
+        with self.assertRaises(KeyError):
+            upload["saved_path"]
+
+    async def test_asgi_post_urlencoded_chunked(self):
+        """Test URL-encoded bodies split across many receive() messages."""
+        self.scope["method"] = "POST"
+        self.scope["path"] = "/echo"
+        self.scope["headers"] = [(b"content-type", b"application/x-www-form-urlencoded")]
+        data = b"a=h%C3%A9llo&b=wor" + b"ld"
+        self.receive = create_receive([
+            {"body": data[i:i + 3], "more_body": i + 3 < len(data)} for i in range(0, len(data), 3)
+        ])
+        await self.app(self.scope, self.receive, self.send_collector)
+        body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
+        self.assertEqual(body.decode("utf-8"), "héllo world")
+
+    async def test_asgi_bad_json_body(self):
+        """Test a malformed JSON body returns 400."""
+        self.scope["method"] = "POST"
+        self.scope["path"] = "/hello"
+        self.scope["headers"] = [(b"content-type", b"application/json")]
+        self.receive = create_receive([{"body": b'{"name": ', "more_body": False}])
+        await self.app(self.scope, self.receive, self.send_collector)
+        self.assertEqual(self.send_collector.messages[0]["status"], 400)
+
+    async def test_parse_multipart_streamed_chunks(self):
+        """Test multipart parsing consumes the body incrementally."""
+        data = (
+            b"--b\r\nContent-Disposition: form-data; name=\"tag\"\r\n\r\none\r\n"
+            b"--b\r\nContent-Disposition: form-data; name=\"tag\"\r\n\r\ntwo\r\n"
+            b"--b\r\nContent-Disposition: form-data; name=\"doc\"; filename=\"d.bin\"\r\n\r\n"
+            + b"x" * 200_000 + b"\r\n--b--\r\n"
+        )
+        fed = []
+        async def chunks():
+            for i in range(0, len(data), 4096):
+                fed.append(i)
+                yield data[i:i + 4096]
+        form, files = await self.app._parse_multipart(chunks(), b"b")
+        self.assertEqual(form, {"tag": ["one", "two"]})
+        self.assertEqual(files["doc"].size, 200_000)
+        self.assertEqual(await files["doc"].read(), b"x" * 200_000)
+        self.assertEqual(len(fed), -(-len(data) // 4096))
+        await self.app.upload_storage.cleanup(files["doc"])
+
+    async def test_spooled_upload_storage(self):
+        """Test small uploads stay in memory and large ones spill to disk in batches."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            storage = SpooledUploadStorage(max_memory_size=10, directory=tmpdir, buffer_size=100)
+            small = await storage.open("a.txt", "text/plain")
+            await storage.write(small, b"tiny")
+            await storage.close(small)
+            self.assertIsNone(small.path)
+            self.assertEqual(await small.read(), b"tiny")
+
+            large = await storage.open("b.bin", "application/octet-stream")
+            with patch("asyncio.to_thread", wraps=asyncio.to_thread) as to_thread:
+                for _ in range(50):
+                    await storage.write(large, b"0123456789")
+                self.assertEqual(to_thread.call_count, 4)
+            await storage.close(large)
+            self.assertTrue(large.path.startswith(tmpdir))
+            self.assertEqual(await large.read(), b"0123456789" * 50)
+
+            await storage.cleanup(small)
+            await storage.cleanup(large)
+            self.assertEqual(os.listdir(tmpdir), [])
+
+    async def test_asgi_uploads_removed_unless_kept(self):
+        """Test uploads are cleaned up at the end of the request unless kept."""
+        with tempfile.TemporaryDirectory() as tmpdir:
+            self.app.upload_storage = SpooledUploadStorage(max_memory_size=0, directory=tmpdir)
+            self.scope["method"] = "POST"
+            self.scope["headers"] = [(b"content-type", b"multipart/form-data; boundary=b")]
+            body = (
+                b"--b\r\nContent-Disposition: form-data; name=\"file\"; filename=\"f.txt\"\r\n\r\n"
+                b"data\r\n--b--\r\n"
+            )
+            uploads = []
+            async def index(file: UploadedFile, keep: bool = False):
+                uploads.append(file)
+                if keep:
+                    file.keep()
+                return file.filename
+            self.app.index = index
+            await self.app(self.scope, create_receive([{"body": body, "more_body": False}]), SendCollector())
+            self.assertFalse(os.path.exists(uploads[0].path))
+            self.scope["query_string"] = b"keep=1"
+            await self.app(self.scope, create_receive([{"body": body, "more_body": False}]), SendCollector())
+            self.assertTrue(os.path.exists(uploads[1].path))
+
+    async def test_asgi_upload_stream(self):
+        """Test UploadStream parameters read a part straight from receive()."""
+        self.scope["method"] = "POST"
+        self.scope["headers"] = [(b"content-type", b"multipart/form-data; boundary=b")]
+        body = (
+            b"--b\r\nContent-Disposition: form-data; name=\"title\"\r\n\r\nreport\r\n"
+            b"--b\r\nContent-Disposition: form-data; name=\"doc\"; filename=\"r.csv\"\r\n"
+            b"Content-Type: text/csv\r\n\r\n" + b"a,b\n" * 5000 + b"\r\n"
+            b"--b\r\nContent-Disposition: form-data; name=\"after\"\r\n\r\nlate\r\n--b--\r\n"
+        )
+        messages = [
+            {"type": "http.request", "body": body[i:i + 1024], "more_body": i + 1024 < len(body)}
+            for i in range(0, len(body), 1024)
+        ]
+        receive = AsyncMock(side_effect=messages)
+        self.app.upload_storage = MagicMock()
+        async def index(title: str, doc: UploadStream):
+            received_before = receive.await_count
+            size = 0
+            async for chunk in doc:
+                size += len(chunk)
+            return f"{title} {doc.filename} {doc.content_type} {size} {received_before < len(messages)}"
+        self.app.index = index
+        await self.app(self.scope, receive, self.send_collector)
+        body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
+        self.assertEqual(body.decode("utf-8"), "report r.csv text/csv 20000 True")
+        self.app.upload_storage.open.assert_not_called()
+
+    async def test_asgi_upload_stream_raw_body(self):
+        """Test UploadStream parameters get the whole body for non-multipart requests."""
+        self.scope["method"] = "PUT"
+        self.scope["headers"] = [(b"content-type", b"application/octet-stream")]
+        receive = create_receive([
+            {"type": "http.request", "body": b"abc", "more_body": True},
+            {"type": "http.request", "body": b"def", "more_body": False},
+        ])
+        async def index(data: UploadStream):
+            return b"".join([chunk async for chunk in data])
+        self.app.index = index
+        await self.app(self.scope, receive, self.send_collector)
+        body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
+        self.assertEqual(body, b"abcdef")
+
+    async def _post_json_records(self, content_type, chunks):
+        self.scope["method"] = "POST"
+        self.scope["headers"] = [(b"content-type", content_type)]
+        receive = create_receive([
+            {"type": "http.request", "body": chunk, "more_body": i < len(chunks) - 1}
+            for i, chunk in enumerate(chunks)
+        ])
+        async def index(records: JsonRecords):
+            return [record async for record in records]
+        self.app.index = index
+        send = SendCollector()
+        await self.app(self.scope, receive, send)
+        body = b"".join(msg["body"] for msg in send.messages if msg["type"] == "http.response.body")
+        return send.messages[0]["status"], body
+
+    async def test_asgi_json_records_array(self):
+        """Test JsonRecords decodes a JSON array split at arbitrary points."""
+        payload = json.dumps([12, {"name": "caf\u00e9", "tags": ["a", "b"]}, "x,]", None, 3.5], ensure_ascii=False).encode()
+        chunks = [payload[i:i + 3] for i in range(0, len(payload), 3)]
+        status, body = await self._post_json_records(b"application/json", chunks)
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), [12, {"name": "caf\u00e9", "tags": ["a", "b"]}, "x,]", None, 3.5])
+
+        status, body = await self._post_json_records(b"application/json", [b" [ ", b"]"])
+        self.assertEqual(json.loads(body), [])
+
+    async def test_asgi_json_records_numbers_split(self):
+        """Test numbers split at every chunk boundary decode whole, for every chunk size."""
+        records = [1, 2.5, -3e2, 4E-1, 0.125, 10, 7e+3, {"n": 1.5e1}, 99]
+        payload = b"[1, 2.5, -3e2, 4E-1 ,0.125,\n10,7e+3, {\"n\": 1.5e1}, 99 ]  "
+        for size in range(1, len(payload) + 1):
+            chunks = [payload[i:i + size] for i in range(0, len(payload), size)]
+            status, body = await self._post_json_records(b"application/json", chunks)
+            self.assertEqual((status, json.loads(body)), (200, records), size)
+
+    async def test_asgi_json_records_ndjson(self):
+        """Test JsonRecords decodes NDJSON lines split across chunks."""
+        status, body = await self._post_json_records(
+            b"application/x-ndjson", [b'{"id": 1}\n{"i', b'd": 2}\n\n', b'[3]']
+        )
+        self.assertEqual(status, 200)
+        self.assertEqual(json.loads(body), [{"id": 1}, {"id": 2}, [3]])
+
+    async def test_asgi_json_records_invalid(self):
+        """Test malformed JsonRecords bodies return 400."""
+        for content_type, chunks in (
+            (b"application/json", [b"[1, 2", b" 3]"]),
+            (b"application/json", [b"[1, 2,]"]),
+            (b"application/json", [b"[1, 2"]),
+            (b"application/json", [b"[1] trailing"]),
+            (b"application/json", [b"[1]", b" ", b"]"]),
+            (b"application/json", [b"[1, 2.", b"]"]),
+            (b"application/x-ndjson", [b'{"id": 1}\n{"id":']),
+        ):
+            status, _ = await self._post_json_records(content_type, chunks)
+            self.assertEqual(status, 400, chunks)
+
+    async def test_asgi_body_limit_streaming(self):
+        """Test the body size limit is enforced while chunks arrive."""
+        app = TestApp(max_body_size=10)
+        self.scope["method"] = "POST"
+        self.scope["path"] = "/echo"
+        self.scope["headers"] = [(b"content-type", b"application/x-www-form-urlencoded")]
+        messages = [{"type": "http.request", "body": b"a=12345&", "more_body": True}] * 100
+        receive = AsyncMock(side_effect=messages)
+        await app(self.scope, receive, self.send_collector)
+        self.assertEqual(self.send_collector.messages[0]["status"], 413)
+        self.assertEqual(receive.await_count, 2)
+
+    async def test_asgi_body_limit_content_length(self):
+        """Test an oversized Content-Length is rejected before reading."""
+        app = TestApp(max_body_size=10)
+        self.scope["method"] = "POST"
+        self.scope["path"] = "/echo"
+        self.scope["headers"] = [(b"content-length", b"1000")]
+        receive = AsyncMock()
+        await app(self.scope, receive, self.send_collector)
+        self.assertEqual(self.send_collector.messages[0]["status"], 413)
+        receive.assert_not_called()
+
+    async def test_asgi_body_limit_handler_override(self):
+        """Test handlers can raise or lower the application's limit."""
+        app = TestApp(max_body_size=4)
+        @max_body_size(100)
+        async def index(a: str, b: str):
+            return a + b
+        app.index = index
+        self.scope["method"] = "POST"
+        self.scope["headers"] = [(b"content-type", b"application/x-www-form-urlencoded")]
+        receive = create_receive([{"type": "http.request", "body": b"a=1&b=2", "more_body": False}])
+        await app(self.scope, receive, self.send_collector)
+        self.assertEqual(self.send_collector.messages[0]["status"], 200)
 
     async def test_asgi_session(self):
         """Test session creation and management."""
@@ -310,6 +1277,122 @@ class TestMicroPie(unittest.IsolatedAsyncioTestCase):
         body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
         self.assertIn("Missing required parameter", body.decode("utf-8"))
 
+    async def test_binding_plan_cached_and_invalidated(self):
+        """Test handler binding plans are reused and rebuilt when a handler is replaced."""
+        self.scope["path"] = "/hello/pat"
+        await self.app(self.scope, self.receive, SendCollector())
+        plan = self.app._binding_plans["hello"]
+        await self.app(self.scope, self.receive, SendCollector())
+        self.assertIs(self.app._binding_plans["hello"], plan)
+        async def hello(first: str, last: str = "smith"):
+            return f"hi {first} {last}"
+        self.app.hello = hello
+        await self.app(self.scope, self.receive, self.send_collector)
+        self.assertIsNot(self.app._binding_plans["hello"], plan)
+        body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
+        self.assertEqual(body.decode("utf-8"), "hi pat smith")
+
+    async def test_asgi_lazy_parsing_skips_unused_inputs(self):
+        """Test handlers that never touch the request skip session and body parsing."""
+        async def index():
+            return "ok"
+        self.app.index = index
+        self.app.session_backend.load = AsyncMock(return_value={})
+        receive = AsyncMock(return_value={"type": "http.request", "body": b"a=1", "more_body": False})
+        self.scope["method"] = "POST"
+        self.scope["headers"] = [(b"cookie", b"session_id=abc")]
+        await self.app(self.scope, receive, self.send_collector)
+        self.assertEqual(self.send_collector.messages[0]["status"], 200)
+        self.app.session_backend.load.assert_not_called()
+        receive.assert_not_called()
+        self.assertFalse(self.app._binding_plans["index"].uses_request)
+        self.assertFalse(self.app._get_binding_plan("hello", self.app.hello).uses_request)
+
+    async def test_asgi_skipped_inputs_fail_loudly(self):
+        """Test a handler reaching the request through a helper can't read or clobber a skipped session."""
+        self.app.index = _index_via_helper
+        self.app.echo = _echo_via_helper
+        await self.app.session_backend.save("abc", {"user": "alice"}, SESSION_TIMEOUT)
+        self.scope["headers"] = [(b"cookie", b"session_id=abc")]
+        with patch("builtins.print"):
+            await self.app(self.scope, self.receive, self.send_collector)
+        self.assertEqual(self.send_collector.messages[0]["status"], 500)
+        self.assertEqual(await self.app.session_backend.load("abc"), {"user": "alice"})
+        self.scope["method"] = "POST"
+        self.scope["path"] = "/echo"
+        self.scope["headers"] = [(b"content-type", b"application/x-www-form-urlencoded")]
+        send = SendCollector()
+        with patch("builtins.print"):
+            await self.app(self.scope, create_receive([{"body": b"a=1", "more_body": False}]), send)
+        self.assertEqual(send.messages[0]["status"], 500)
+
+    async def test_asgi_decorated_handlers_parse_request(self):
+        """Test handlers behind decorators and callable handlers are routed and get their session and body."""
+        def logged(func):
+            @functools.wraps(func)
+            async def wrapper(*args, **kwargs):
+                return await func(*args, **kwargs)
+            return wrapper
+
+        class DecoratedApp(App):
+            @logged
+            async def who(self):
+                return self.request.session.get("user", "nobody")
+
+            @logged
+            async def post(self):
+                return self.request.body_params["a"][0]
+
+            @memoize(ttl=0)
+            async def stats(self):
+                return "stats"
+
+            class Config:
+                debug = False
+
+        self.assertEqual(set(DecoratedApp.routes), {"who", "post", "stats"})
+        app = DecoratedApp()
+        await app.session_backend.save("abc", {"user": "alice"}, SESSION_TIMEOUT)
+        for method, path, body, expected in (
+            ("GET", "/who", b"", b"alice"),
+            ("POST", "/post", b"a=1", b"1"),
+            ("GET", "/stats", b"", b"stats"),
+        ):
+            scope = dict(self.scope, method=method, path=path, headers=[
+                (b"cookie", b"session_id=abc"), (b"content-type", b"application/x-www-form-urlencoded"),
+            ])
+            send = SendCollector()
+            await app(scope, create_receive([{"body": body, "more_body": False}]), send)
+            self.assertEqual(send.messages[0]["status"], 200, path)
+            self.assertEqual(send.messages[1]["body"], expected)
+        self.assertTrue(app._binding_plans["who"].uses_request)
+
+    async def test_asgi_session_not_loaded_without_cookie(self):
+        """Test the session backend is not called when there is no session cookie."""
+        self.app.session_backend.load = AsyncMock(return_value={})
+        await self.app(self.scope, self.receive, self.send_collector)
+        self.app.session_backend.load.assert_not_called()
+        self.assertTrue(self.app._binding_plans["index"].uses_request)
+
+    async def test_asgi_sync_handler_in_executor(self):
+        """Test sync handlers and sync generator bodies run in the thread pool."""
+        app = TestApp(sync_workers=2)
+        threads = []
+        def index(name: str = "pat"):
+            threads.append(threading.current_thread().name)
+            def chunks():
+                threads.append(threading.current_thread().name)
+                yield f"hi {app.request.method} {name}"
+            return chunks()
+        app.index = index
+        await app(self.scope, self.receive, self.send_collector)
+        body = b"".join(msg["body"] for msg in self.send_collector.messages if msg["type"] == "http.response.body")
+        self.assertEqual(body.decode("utf-8"), "hi GET pat")
+        self.assertTrue(all(name.startswith("micropie") for name in threads))
+        self.assertEqual(len(threads), 2)
+        self.assertEqual(app.executor_queue_depth, 0)
+        app.executor.shutdown()
+
     async def test_asgi_handler_exception(self):
         """Test handler exception triggers 500 error."""
         self.scope["path"] = "/raise_exception"